@@ -0,0 +1,116 @@
+###################################################################################################################################################
+#  cseries_async.py - asyncio interface to the Tricontinent cseries Data Terminal driver
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Awaitable versions of the cseries_DT commands so many pumps on many ports can be run from one event loop,
+#           e.g. dispensing from 'Tecan' and 'TriCont' at the same time with asyncio.gather
+#
+#  Refrences:
+#       tricont_cseries_DT_Driver.py
+#           Serial framing, shared bus and command library used underneath
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import asyncio
+
+from tricont_cseries_DT_Driver import cseries_DT, cseries_idle_wait, Valve_Pos
+
+###################################################################################################################################################
+# Class Definitions
+
+class cseries_async_DT(object):
+    """Class for commanding a cseries pump from asyncio code
+
+        Serial exchanges run in worker threads and hold the shared bus only for one frame,
+        all waiting is done with asyncio.sleep so other pumps keep the bus busy meanwhile.
+        Calls on one pump are serialized with a lock, calls on different pumps run concurrently.
+        """
+    def __init__(self, pump):
+        if isinstance(pump, str):
+            pump = cseries_DT(pump)
+        self.pump = pump
+        self.lock = asyncio.Lock()
+
+    @property
+    def pump_address(self):
+        return self.pump.pump_address
+
+    async def open_serial(self):
+        await asyncio.to_thread(self.pump.open_serial)
+
+    async def close_serial(self):
+        await asyncio.to_thread(self.pump.close_serial)
+
+    async def config_pump(self):
+        async with self.lock:
+            await asyncio.to_thread(self.pump.config_pump)
+
+    async def send_cmd(self, command, operand = None) -> bytes:
+        """Sends one command and returns the reply bytes."""
+        async with self.lock:
+            return await self._send_cmd(command, operand)
+
+    async def send_cmd_multi(self, commands = list, operands = list) -> bytes:
+        """Sends a multi command program and returns the reply bytes."""
+        async with self.lock:
+            return await self._send_cmd_multi(commands, operands)
+
+    async def wait_idle(self):
+        """Waits until the pump is ready, same prediction, backoff, error handling, timeouts and hooks as cseries_DT.wait4idle."""
+        async with self.lock:
+            return await self._wait_idle()
+
+    async def _send_cmd(self, command, operand = None):
+        await asyncio.to_thread(self.pump.send_cmd, command, operand)
+        return self.pump.read_text_bytes
+
+    async def _send_cmd_multi(self, commands, operands):
+        await asyncio.to_thread(self.pump.send_cmd_multi, commands, operands)
+        return self.pump.read_text_bytes
+
+    async def _wait_idle(self):
+        pump = self.pump
+        waiter = cseries_idle_wait(pump)
+        while True:
+            await asyncio.sleep(waiter.delay())
+            if waiter.check(await asyncio.to_thread(pump.bus.transact, pump.pump_address, waiter.frame)):
+                return True
+
+    async def switch_valve(self, destination_valve = str):
+        """Moves the valve to destination_valve unless it is already there.
+            The valve position comes from the state cache, the pump is only queried when the cache is invalid."""
+        pump = self.pump
+        async with self.lock:
+            if pump.move_predicted is not None:
+                await self._wait_idle()         # Pump ignores a valve move while it is busy
+            if pump.state.valve is None:
+                await self._send_cmd('?', '6')
+            if pump.state.valve == Valve_Pos[destination_valve]:
+                print('\nValve is already at destination valve '+ destination_valve + '! No change made by switch_valve')
+            else:
+                await self._send_cmd(Valve_Pos[destination_valve], None)
+                print('\nValve moved to Destination: '+ destination_valve)
+
+    async def move_to_ml(self, abs_ml):
+        """Moves the plunger to the absolute position abs_ml and waits for the move to finish."""
+        async with self.lock:
+            await self._wait_idle()
+            await asyncio.to_thread(self.pump.move2pos_abs_ml, abs_ml)
+            await self._wait_idle()
+
+    async def dispense_ml(self, ml2disp = float):
+        """Dispenses ml2disp to the Outlet valve as one compiled program."""
+        async with self.lock:
+            commands, operands = self.pump.compile_disp_ml(ml2disp)
+            await self._wait_idle()
+            await self._send_cmd_multi(commands, operands)
+            await self._wait_idle()
+        print("Finished Dispensing "+str(ml2disp)+"ml to Outlet")
+
+async def gather_dispense(volumes:dict):
+    """Dispenses on several pumps at once, volumes maps cseries_async_DT pumps to mL.
+        Returns once the slowest pump has finished."""
+    await asyncio.gather(*(pump.dispense_ml(ml) for pump, ml in volumes.items()))
@@ -0,0 +1,190 @@
+###################################################################################################################################################
+#  cseries_bench.py - Repeatable benchmark suite for the Tricontinent cseries Data Terminal driver
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Measures frame round trip latency, commands per second on a shared bus, wait4idle poll overhead,
+#           config_pump start up time and end to end disp_ml time for a range of volumes and pump counts.
+#           Runs unattended against simulated pumps (default) or hardware and saves the results as JSON
+#           so releases can be compared.
+#
+#           Simulated:  python cseries_bench.py --counts 1 2 4 --volumes 0.25 1 --output bench.json
+#           Hardware:   python cseries_bench.py --pumps Tecan TriCont --output bench.json
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+
+from pathlib import Path
+from time import monotonic, strftime
+
+from tricont_cseries_DT_Driver import cseries_DT, PUMP_ADDRESSES, config_pumps
+from cseries_config import generate_fleet, write_config
+from cseries_sim import attach_sim
+
+###################################################################################################################################################
+# Constants
+
+#: Port name used for the simulated bus
+SIM_PORT = 'sim://bench'
+
+###################################################################################################################################################
+# Functions
+
+def summarize(samples):
+    """Returns count, mean, min, median, p95 and max of a list of seconds."""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {'count': len(ordered), 'mean': statistics.fmean(ordered), 'min': ordered[0],
+            'median': statistics.median(ordered), 'p95': ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+            'max': ordered[-1]}
+
+def quiet(function, *args):
+    """Runs function with its progress prints discarded."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args)
+
+def run_threads(targets):
+    """Runs each (function, args) in its own thread and returns the wall time until all are done."""
+    threads = [threading.Thread(target = function, args = args) for function, args in targets]
+    start = monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return monotonic() - start
+
+def sim_pumps(count, baudrate, time_scale):
+    """Creates count simulated pumps on one simulated bus and returns cseries_DT instances for them."""
+    config = write_config(generate_fleet([SIM_PORT], count, 'sim{address_index}', baudrate = baudrate),
+                          Path(tempfile.mkdtemp()) / 'cseries_bench_config.csv')
+    attach_sim(SIM_PORT, PUMP_ADDRESSES[:count], baudrate, time_scale = time_scale)
+    return [quiet(cseries_DT, 'sim' + str(index), config) for index in range(count)]
+
+def bench_frame_latency(pumps, frames):
+    """Round trip time of a status query frame, one pump at a time."""
+    samples = []
+    for pump in pumps:
+        frame = ('/' + pump.pump_address + 'QR\r').encode()
+        for _ in range(frames):
+            start = monotonic()
+            pump.handle.transact(frame)
+            samples.append(monotonic() - start)
+    return summarize(samples)
+
+def bench_bus_throughput(pumps, seconds):
+    """Commands per second with every pump on the bus sending status queries from its own thread."""
+    counts = [0] * len(pumps)
+
+    def hammer(index, pump):
+        frame = ('/' + pump.pump_address + 'QR\r').encode()
+        end = monotonic() + seconds
+        while monotonic() < end:
+            pump.handle.transact(frame)
+            counts[index] += 1
+
+    wall = run_threads([(hammer, (index, pump)) for index, pump in enumerate(pumps)])
+    return {'pumps': len(pumps), 'commands': sum(counts), 'seconds': wall, 'commands_per_sec': sum(counts) / wall}
+
+def bench_wait_overhead(pump, moves):
+    """Polls and prediction error of wait4idle over full stroke moves."""
+    polls, errors, waits = [], [], []
+    for index in range(moves):
+        pump.move2pos_abs_ml(pump.volumes.full_volume if index % 2 == 0 else 0)
+        start = monotonic()
+        pump.wait4idle(pump.pump_address)
+        waits.append(monotonic() - start)
+        polls.append(pump.motion.last_polls)
+        if pump.motion.last_error is not None:
+            errors.append(pump.motion.last_error)
+    return {'moves': moves, 'polls_mean': statistics.fmean(polls), 'polls_max': max(polls),
+            'wait': summarize(waits), 'prediction_error': summarize(errors)}
+
+def bench_config(pumps):
+    """Time for config_pump on each pump, then for config_pumps on the whole rig from a cold cache."""
+    samples = []
+    for pump in pumps:
+        start = monotonic()
+        quiet(pump.config_pump)
+        samples.append(monotonic() - start)
+    for pump in pumps:
+        pump.state.invalidate()
+    start = monotonic()
+    quiet(config_pumps, pumps)
+    return {'per_pump': summarize(samples), 'all_pumps': monotonic() - start}
+
+def bench_dispense(pumps, volumes, counts):
+    """End to end disp_ml wall time for each volume with 1..n pumps dispensing at once."""
+    results = []
+    for count in counts:
+        for volume in volumes:
+            wall = quiet(run_threads, [(pump.disp_ml, (volume,)) for pump in pumps[:count]])
+            results.append({'pumps': count, 'volume_ml': volume, 'seconds': wall})
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True,
+                              cwd = Path(__file__).parent).stdout.strip()
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark the cseries Data Terminal driver')
+    parser.add_argument('--pumps', nargs = '+', help = 'Pump names from cseries_config.csv, benchmarks hardware')
+    parser.add_argument('--counts', nargs = '+', type = int, default = [1, 2, 4], help = 'Pump counts to dispense with')
+    parser.add_argument('--volumes', nargs = '+', type = float, default = [0.25, 1.0], help = 'Volumes to dispense (mL)')
+    parser.add_argument('--frames', type = int, default = 100, help = 'Frames per pump for the latency test')
+    parser.add_argument('--seconds', type = float, default = 2.0, help = 'Length of the bus throughput test')
+    parser.add_argument('--moves', type = int, default = 4, help = 'Moves for the wait4idle test')
+    parser.add_argument('--baud', type = int, default = 9600, help = 'Baud rate of the simulated bus')
+    parser.add_argument('--time-scale', type = float, default = 1.0, help = 'Move time scale of the simulated pumps')
+    parser.add_argument('--output', default = 'bench_results.json', help = 'JSON file to write')
+    args = parser.parse_args()
+
+    if args.pumps:
+        pumps = [quiet(cseries_DT, name) for name in args.pumps]
+        mode = 'hardware'
+    else:
+        pumps = sim_pumps(max(args.counts), args.baud, args.time_scale)
+        mode = 'simulated'
+    counts = [count for count in args.counts if count <= len(pumps)]
+    for pump in pumps:
+        quiet(pump.open_serial)
+
+    results = {'mode': mode, 'timestamp': strftime('%Y-%m-%dT%H:%M:%S'), 'revision': git_revision(),
+               'python': platform.python_version(), 'baudrate': pumps[0].baudrate, 'pump_count': len(pumps)}
+    print('Config...')
+    results['config_pump'] = bench_config(pumps)
+    for pump in pumps:
+        pump.send_cmd('Z', None)
+    for pump in pumps:
+        pump.wait4idle(pump.pump_address)
+    print('Frame latency...')
+    results['frame_latency'] = bench_frame_latency(pumps, args.frames)
+    print('Bus throughput...')
+    results['bus_throughput'] = [bench_bus_throughput(pumps[:count], args.seconds) for count in counts]
+    print('wait4idle overhead...')
+    results['wait4idle'] = bench_wait_overhead(pumps[0], args.moves)
+    print('Dispense...')
+    results['disp_ml'] = bench_dispense(pumps, args.volumes, counts)
+
+    for pump in pumps:
+        quiet(pump.close_serial)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent = 2)
+    print('Results saved to ' + args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+###################################################################################################################################################
+#  cseries_calibration.py - Volume to step conversion and calibration curves for Tricontinent cseries Syringe Pumps
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Converts volumes to plunger steps and back for one pump, one value at a time or whole NumPy arrays at
+#           once. Without a calibration the conversion is the straight max_steps / syringe_volume line, with one it
+#           follows a piecewise linear curve of measured points. Points are saved as a fraction of the full stroke,
+#           so a curve measured in one increment mode stays right in the other, up to the 196000 step ceiling of
+#           increment mode 1 with stepping mode 2. Curves live in <config name>_calibration.csv next to the config.
+#
+#           volumes = cseries_volume_map.for_pump(pump)
+#           steps = volumes.steps(numpy.linspace(0, 1, 5000))
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import csv
+import threading
+
+from bisect import bisect_right
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:     # Only needed for array conversion
+    np = None
+
+from cseries_config import DEFAULT_CONFIG_FILE
+
+###################################################################################################################################################
+# Constants
+
+#: Column headers of the calibration file
+CALIBRATION_COLUMNS = ['Pump Name', 'Stroke Fraction', 'Volume']
+
+###################################################################################################################################################
+# Class Definitions
+
+class cseries_volume_map(object):
+    """Class converting volumes (mL) to plunger steps and back for one pump
+
+        Args:
+            max_steps: Full stroke in steps for the pump's increment and stepping mode
+            syringe_volume: Nominal syringe volume (mL)
+            curve: Calibration points as (stroke fraction 0-1, measured mL) pairs, None for the straight line.
+                   (0, 0) and the full stroke are added when missing, the full stroke taking the nominal volume.
+
+        Scalars give ints and floats back, lists and arrays give NumPy arrays.
+        Steps are rounded to the nearest step.
+        """
+    def __init__(self, max_steps, syringe_volume, curve = None):
+        self.max_steps = int(max_steps)
+        self.syringe_volume = float(syringe_volume)
+        points = sorted((float(fraction), float(volume)) for fraction, volume in (curve or ()))
+        if not points or points[0][0] > 0:
+            points.insert(0, (0.0, 0.0))
+        if points[-1][0] < 1:
+            points.append((1.0, self.syringe_volume))
+        _check_curve(points)
+        self.curve = points
+        self.step_points = [fraction * self.max_steps for fraction, _ in points]
+        self.volume_points = [volume for _, volume in points]
+
+    @classmethod
+    def for_pump(cls, pump, config_file = None):
+        """Returns the map for a cseries_DT pump with its saved calibration curve, if any."""
+        return cls(pump.max_steps, pump.syringe_volume, load_calibration(config_file).get(pump.config.name))
+
+    @property
+    def full_volume(self):
+        """Volume of one full stroke."""
+        return self.volume_points[-1]
+
+    @property
+    def calibrated(self):
+        return len(self.curve) > 2 or self.curve[-1][1] != self.syringe_volume
+
+    def steps(self, volumes):
+        """Absolute plunger position in steps for each volume in the syringe."""
+        if not _is_scalar(volumes):
+            return np.rint(np.interp(np.asarray(volumes, dtype = float), self.volume_points, self.step_points,
+                                     left = -1, right = self.max_steps + 1)).astype(np.int64)
+        return int(round(_interp(float(volumes), self.volume_points, self.step_points, -1, self.max_steps + 1)))
+
+    def volumes(self, steps):
+        """Volume in the syringe at each absolute plunger position."""
+        if not _is_scalar(steps):
+            return np.interp(np.asarray(steps, dtype = float), self.step_points, self.volume_points)
+        return _interp(float(steps), self.step_points, self.volume_points)
+
+    def in_range(self, steps):
+        """True for every step count the plunger can reach, 0 to max_steps."""
+        if not _is_scalar(steps):
+            steps = np.asarray(steps)
+            return (steps >= 0) & (steps <= self.max_steps)
+        return 0 <= steps <= self.max_steps
+
+    def check(self, steps):
+        """Raises ValueError if any step count is out of reach, returns steps."""
+        if not _is_scalar(steps):
+            if not np.all(self.in_range(steps)):
+                raise ValueError('Positions outside 0-' + str(self.max_steps) + ' steps')
+        elif not self.in_range(steps):
+            raise ValueError('Position ' + str(steps) + ' outside 0-' + str(self.max_steps) + ' steps')
+        return steps
+
+###################################################################################################################################################
+# Functions
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+def calibration_file(config_file = None):
+    """Calibration file kept next to config_file (default cseries_config.csv)."""
+    path = Path(config_file if config_file is not None else DEFAULT_CONFIG_FILE)
+    return path.with_name(path.stem + '_calibration.csv')
+
+def load_calibration(config_file = None):
+    """Returns {pump name: [(stroke fraction, mL), ...]} from the calibration file of config_file,
+        an empty dict when there is none. The file is parsed again only when it changes."""
+    path = calibration_file(config_file)
+    try:
+        stamp = path.stat().st_mtime_ns
+    except OSError:
+        return {}
+    with _loaded_lock:
+        loaded = _loaded.get(path)
+        if loaded is None or loaded[0] != stamp:
+            curves = {}
+            with path.open('r', newline = '') as file:
+                reader = csv.reader(file)
+                next(reader, None)      # Header
+                for line, row in enumerate(reader, start = 2):
+                    if not row or not any(field.strip() for field in row):
+                        continue
+                    try:
+                        curves.setdefault(row[0].strip(), []).append((float(row[1]), float(row[2])))
+                    except (IndexError, ValueError):
+                        raise ValueError('Bad calibration row (line ' + str(line) + ') in ' + str(path)) from None
+            loaded = (stamp, curves)
+            _loaded[path] = loaded
+        return loaded[1]
+
+def save_calibration(pump_name, points, max_steps, config_file = None):
+    """Saves measured (steps, mL) points for a pump, replacing its earlier curve. Steps are stored as
+        a fraction of max_steps, the full stroke of the mode they were measured in. Returns the path."""
+    curves = dict(load_calibration(config_file))
+    curves[pump_name] = [(steps / float(max_steps), volume) for steps, volume in points]
+    _check_curve(sorted(curves[pump_name]))
+    path = calibration_file(config_file)
+    with path.open('w', newline = '') as file:
+        writer = csv.writer(file)
+        writer.writerow(CALIBRATION_COLUMNS)
+        for name, curve in curves.items():
+            for fraction, volume in sorted(curve):
+                writer.writerow([name, repr(fraction), repr(volume)])
+    return path
+
+def _check_curve(points):
+    for (fraction, volume), (next_fraction, next_volume) in zip(points, points[1:]):
+        if next_fraction <= fraction or next_volume <= volume:
+            raise ValueError('Calibration points must rise in both stroke fraction and volume')
+    if points and (points[0][0] < 0 or points[-1][0] > 1):
+        raise ValueError('Calibration stroke fractions must be within 0-1')
+
+def _is_scalar(value):
+    """True for a single number, anything else is converted with NumPy."""
+    if np is None:
+        return True
+    return isinstance(value, (int, float)) or np.ndim(value) == 0
+
+def _interp(x, xs, ys, left = None, right = None):
+    """Piecewise linear interpolation of one value, like numpy.interp."""
+    if x < xs[0]:
+        return ys[0] if left is None else left
+    if x > xs[-1]:
+        return ys[-1] if right is None else right
+    index = min(bisect_right(xs, x), len(xs) - 1)
+    x0, x1, y0, y1 = xs[index - 1], xs[index], ys[index - 1], ys[index]
+    return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
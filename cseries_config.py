@@ -0,0 +1,220 @@
+###################################################################################################################################################
+#  cseries_config.py - Pump configuration registry for the Tricontinent cseries Data Terminal driver
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Parses cseries_config.csv once per process, checks and converts every field up front and indexes the pumps
+#           by name, port and address. Also generates configuration files for large fleets without interactive input.
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import csv
+import threading
+
+from collections import namedtuple
+from pathlib import Path
+
+from cseries_oem import PROTOCOL_DT, PROTOCOLS
+
+###################################################################################################################################################
+# Constants
+
+#: Default configuration file, next to the driver
+DEFAULT_CONFIG_FILE = Path(__file__).with_name('cseries_config.csv')
+
+#: Column headers of the configuration file, in order
+CONFIG_COLUMNS = ['Pump Name', 'Syringe Volume','Increment Mode', "Stepping Mode",
+                  'Accleration/Decleration Slope Code', 'Start Velocity', 'Top Velocity',
+                  'Cutoff Velocity', 'Cutoff Increments',  'Pump Address',
+                  'Pump Port', 'Baud Rate', 'Timeout', 'Protocol']
+
+#: Columns a row must have, files written before the Protocol column use the Data Terminal protocol
+REQUIRED_COLUMNS = len(CONFIG_COLUMNS) - 1
+
+#: Full stroke steps by (Increment Mode, Stepping Mode)
+MAX_STEPS = {(0, 1) : 3000, (0, 2) : 24000, (1, 1) : 24000, (1, 2) : 196000}
+
+# Allowed ranges of the integer settings, inclusive
+SETTING_RANGES = {
+    'acc_slope' : (1, 20),
+    'start_velo' : (1, 1000),
+    'top_velo' : (1, 6000),
+    'cutoff_velo' : (0, 2700),
+    'cutoff_incre' : (0, 25),
+}
+
+#: Data Terminal address characters for address switch settings 0-F
+ADDRESS_CHARS = '123456789:;<=>?@'
+
+# Mode 0 power-up defaults used when generating configuration rows
+FLEET_DEFAULTS = {'syringe_volume' : 1.0, 'incre_mode' : 0, 'step_mode' : 1, 'acc_slope' : 14, 'start_velo' : 900,
+                  'top_velo' : 5600, 'cutoff_velo' : 900, 'cutoff_incre' : 0, 'baudrate' : 9600, 'timeout' : 1.0,
+                  'protocol' : PROTOCOL_DT}
+
+###################################################################################################################################################
+# Class Definitions
+
+class cseries_config_error(ValueError):
+    """Raised for a missing pump or an invalid row in the configuration file"""
+
+_config_fields = ['name', 'syringe_volume', 'incre_mode', 'step_mode', 'acc_slope', 'start_velo', 'top_velo',
+                  'cutoff_velo', 'cutoff_incre', 'address', 'port', 'baudrate', 'timeout', 'protocol']
+
+class cseries_pump_config(namedtuple('cseries_pump_config', _config_fields, defaults = (PROTOCOL_DT,))):
+    """Checked, typed configuration of one pump, one row of the configuration file"""
+    __slots__ = ()
+
+    @property
+    def max_steps(self):
+        return MAX_STEPS[(self.incre_mode, self.step_mode)]
+
+    @classmethod
+    def from_row(cls, row, line = None):
+        """Converts and checks one CSV row, raises cseries_config_error naming the line on a bad value."""
+        where = ' (line ' + str(line) + ')' if line is not None else ''
+        if len(row) < REQUIRED_COLUMNS:
+            raise cseries_config_error('Config row has ' + str(len(row)) + ' fields, expected ' + str(len(CONFIG_COLUMNS)) + where)
+        try:
+            config = cls(name = row[0].strip(), syringe_volume = float(row[1]), incre_mode = int(row[2]),
+                         step_mode = int(row[3]), acc_slope = int(row[4]), start_velo = int(row[5]),
+                         top_velo = int(row[6]), cutoff_velo = int(row[7]), cutoff_incre = int(row[8]),
+                         address = row[9].strip(), port = row[10].strip(), baudrate = int(row[11]),
+                         timeout = float(row[12]),
+                         protocol = row[13].strip().upper() if len(row) > REQUIRED_COLUMNS and row[13].strip() else PROTOCOL_DT)
+        except ValueError as error:
+            raise cseries_config_error('Config value could not be converted' + where + ': ' + str(error)) from None
+        config.check(where)
+        return config
+
+    def check(self, where = ''):
+        name = "Pump '" + self.name + "'" + where
+        if not self.name:
+            raise cseries_config_error('Config row has no pump name' + where)
+        if self.syringe_volume <= 0:
+            raise cseries_config_error(name + ': Syringe Volume must be positive')
+        if (self.incre_mode, self.step_mode) not in MAX_STEPS:
+            raise cseries_config_error(name + ': Increment Mode must be 0 or 1 and Stepping Mode 1 or 2')
+        for field, (low, high) in SETTING_RANGES.items():
+            value = getattr(self, field)
+            if not low <= value <= high:
+                raise cseries_config_error(name + ': ' + field + ' ' + str(value) + ' outside ' + str(low) + '-' + str(high))
+        if len(self.address) != 1 or self.address not in ADDRESS_CHARS:
+            raise cseries_config_error(name + ': Pump Address must be one of ' + ADDRESS_CHARS)
+        if not self.port:
+            raise cseries_config_error(name + ': Pump Port is empty')
+        if self.baudrate <= 0 or self.timeout <= 0:
+            raise cseries_config_error(name + ': Baud Rate and Timeout must be positive')
+        if self.protocol not in PROTOCOLS:
+            raise cseries_config_error(name + ': Protocol must be one of ' + ', '.join(PROTOCOLS))
+
+    def to_row(self):
+        return [self.name, _number(self.syringe_volume), self.incre_mode, self.step_mode, self.acc_slope,
+                self.start_velo, self.top_velo, self.cutoff_velo, self.cutoff_incre, self.address, self.port,
+                self.baudrate, _number(self.timeout), self.protocol]
+
+class cseries_config_registry(object):
+    """Class holding every pump of a configuration file, indexed by name, port and (port, address)
+
+        Use cseries_config_registry.load, it parses each file once per process and only
+        parses it again when the file changes on disk.
+        """
+    _loaded = {}
+    _loaded_lock = threading.Lock()
+
+    def __init__(self, pumps):
+        self.pumps = list(pumps)
+        self.by_name = {}
+        self.by_port = {}
+        self.by_address = {}
+        for pump in self.pumps:
+            if pump.name in self.by_name:
+                raise cseries_config_error("Pump name '" + pump.name + "' is used twice")
+            if (pump.port, pump.address) in self.by_address:
+                raise cseries_config_error("Pump '" + pump.name + "' uses the address of pump '" +
+                                           self.by_address[(pump.port, pump.address)].name + "' on " + pump.port)
+            self.by_name[pump.name] = pump
+            self.by_port.setdefault(pump.port, []).append(pump)
+            self.by_address[(pump.port, pump.address)] = pump
+
+    @classmethod
+    def load(cls, config_file = None):
+        """Returns the registry for config_file (default cseries_config.csv), parsing it only when needed."""
+        path = Path(config_file if config_file is not None else DEFAULT_CONFIG_FILE).resolve()
+        stamp = path.stat().st_mtime_ns
+        with cls._loaded_lock:
+            loaded = cls._loaded.get(path)
+            if loaded is None or loaded[0] != stamp:
+                loaded = (stamp, cls.from_csv(path))
+                cls._loaded[path] = loaded
+            return loaded[1]
+
+    @classmethod
+    def forget(cls, config_file = None):
+        """Drops a cached registry so the next load parses the file again."""
+        path = Path(config_file if config_file is not None else DEFAULT_CONFIG_FILE).resolve()
+        with cls._loaded_lock:
+            cls._loaded.pop(path, None)
+
+    @classmethod
+    def from_csv(cls, config_file):
+        with Path(config_file).open('r', newline = '') as file:
+            reader = csv.reader(file)
+            next(reader, None)      # Header
+            return cls(cseries_pump_config.from_row(row, line) for line, row in enumerate(reader, start = 2)
+                       if row and any(field.strip() for field in row))
+
+    def get(self, pump_name:str) -> cseries_pump_config:
+        try:
+            return self.by_name[pump_name]
+        except KeyError:
+            raise cseries_config_error("Pump '" + str(pump_name) + "' not found in config") from None
+
+    def on_port(self, port:str):
+        return list(self.by_port.get(port, ()))
+
+    def at(self, port:str, address:str) -> cseries_pump_config:
+        try:
+            return self.by_address[(port, str(address))]
+        except KeyError:
+            raise cseries_config_error('No pump at address ' + str(address) + ' on ' + str(port)) from None
+
+    def names(self):
+        return list(self.by_name)
+
+###################################################################################################################################################
+# Functions
+
+def generate_fleet(ports, pumps_per_port = 16, name_format = 'Pump_{port_index}_{address_index}', **settings):
+    """Builds configurations for every address on every port without interactive input.
+        name_format can use {port_index}, {address_index}, {address} and {port}.
+        settings override FLEET_DEFAULTS for every pump, e.g. syringe_volume = 5."""
+    if not 1 <= pumps_per_port <= len(ADDRESS_CHARS):
+        raise cseries_config_error('pumps_per_port must be 1-' + str(len(ADDRESS_CHARS)))
+    values = dict(FLEET_DEFAULTS, **settings)
+    pumps = []
+    for port_index, port in enumerate(ports):
+        for address_index in range(pumps_per_port):
+            address = ADDRESS_CHARS[address_index]
+            name = name_format.format(port_index = port_index, address_index = address_index, address = address, port = port)
+            config = cseries_pump_config(name = name, address = address, port = port, **values)
+            config.check()
+            pumps.append(config)
+    return pumps
+
+def write_config(pumps, config_file = None):
+    """Writes pump configurations as a configuration file (default cseries_config.csv)."""
+    registry = cseries_config_registry(pumps)   # Checks for duplicate names and addresses before writing
+    path = Path(config_file if config_file is not None else DEFAULT_CONFIG_FILE)
+    with path.open('w', newline = '') as file:
+        writer = csv.writer(file)
+        writer.writerow(CONFIG_COLUMNS)
+        for pump in registry.pumps:
+            writer.writerow(pump.to_row())
+    cseries_config_registry.forget(path)
+    return path
+
+def _number(value):
+    """Writes whole floats without the trailing .0, as the hand written file does."""
+    return int(value) if float(value).is_integer() else value
@@ -0,0 +1,120 @@
+###################################################################################################################################################
+#  cseries_discovery.py - Port and address discovery for Tricontinent cseries Syringe Pumps
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Finds every pump on every candidate serial port. All ports matching the Tricont USB vendor/product ids are
+#           scanned at once, each probing addresses 1-F with a short timeout status query. The port/address/firmware map
+#           is saved to disk and later runs only check the saved entries instead of scanning everything again.
+#
+#           python cseries_discovery.py            Uses the saved map when every pump on it still answers
+#           python cseries_discovery.py --rescan   Always scans every port
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import argparse
+import json
+import serial
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from serial.tools import list_ports
+from time import strftime
+
+from tricont_cseries_DT_Driver import (cseries_bus, cseries_Status, PUMP_ADDRESSES, DEFAULT_IO_BAUDRATE, CMD_REPORT_STATUS,
+                                       target_vendor_id, target_product_id)
+
+###################################################################################################################################################
+# Constants
+
+#: File the discovered device map is saved to
+DEVICE_MAP_FILE = Path(__file__).with_name('cseries_devices.json')
+#: Reply timeout of a probe, an absent pump costs this long (sec)
+PROBE_TIMEOUT = 0.03
+#: Command reporting the firmware version
+CMD_REPORT_FIRMWARE = '&'
+
+###################################################################################################################################################
+# Functions
+
+def candidate_ports():
+    """Returns the devices of every serial port with the Tricont vendor and product ids."""
+    return [port.device for port in list_ports.comports()
+            if port.vid == target_vendor_id and port.pid == target_product_id]
+
+def probe_port(port, addresses = PUMP_ADDRESSES, baudrate = DEFAULT_IO_BAUDRATE, timeout = PROBE_TIMEOUT):
+    """Probes addresses on one port, returns a device entry (port, address, firmware) for each pump that answers.
+        A port that can not be opened gives no entries."""
+    bus = cseries_bus.get_bus(port, baudrate)
+    try:
+        bus.open()
+    except (OSError, serial.SerialException):
+        return []
+    devices = []
+    try:
+        for address in addresses:
+            frames = bus.handle(address).frames
+            if not bus.transact(address, frames.frame(CMD_REPORT_STATUS), timeout):
+                continue
+            reply = bus.transact(address, frames.frame(CMD_REPORT_FIRMWARE), timeout)
+            firmware = cseries_Status(reply).data if reply else ''
+            devices.append({'port': port, 'address': address, 'firmware': firmware})
+    finally:
+        bus.close()
+    return devices
+
+def scan(ports = None, addresses = PUMP_ADDRESSES, baudrate = DEFAULT_IO_BAUDRATE):
+    """Probes every port at the same time, returns the device entries found on all of them."""
+    ports = candidate_ports() if ports is None else list(ports)
+    if not ports:
+        return []
+    with ThreadPoolExecutor(max_workers = len(ports)) as executor:
+        results = executor.map(lambda port: probe_port(port, addresses, baudrate), ports)
+    return [device for devices in results for device in devices]
+
+def verify(devices, baudrate = DEFAULT_IO_BAUDRATE):
+    """Checks only the given device entries, one probe each with all ports at once. Returns True if all answer."""
+    by_port = {}
+    for device in devices:
+        by_port.setdefault(device['port'], []).append(device['address'])
+    if not by_port:
+        return False
+    with ThreadPoolExecutor(max_workers = len(by_port)) as executor:
+        found = executor.map(lambda item: len(probe_port(item[0], item[1], baudrate)) == len(item[1]), by_port.items())
+    return all(found)
+
+def load_device_map(map_file = DEVICE_MAP_FILE):
+    """Returns the saved device entries, or None when there is no readable map."""
+    try:
+        with Path(map_file).open('r') as file:
+            return json.load(file)['devices']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def save_device_map(devices, map_file = DEVICE_MAP_FILE):
+    with Path(map_file).open('w') as file:
+        json.dump({'saved': strftime('%Y-%m-%dT%H:%M:%S'), 'devices': devices}, file, indent = 2)
+
+def discover(ports = None, use_cache = True, map_file = DEVICE_MAP_FILE, baudrate = DEFAULT_IO_BAUDRATE):
+    """Returns the device map. When use_cache is set and every saved pump still answers the saved map is used,
+        otherwise all ports are scanned and the new map is saved."""
+    if use_cache:
+        devices = load_device_map(map_file)
+        if devices and verify(devices, baudrate):
+            return devices
+    devices = scan(ports, baudrate = baudrate)
+    save_device_map(devices, map_file)
+    return devices
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Find Tricont C-Series pumps on the serial ports')
+    parser.add_argument('--rescan', action = 'store_true', help = 'Ignore the saved device map')
+    parser.add_argument('--baud', type = int, default = DEFAULT_IO_BAUDRATE)
+    args = parser.parse_args()
+    found = discover(use_cache = not args.rescan, baudrate = args.baud)
+    if not found:
+        print('No Tricont C-Series Pumps found')
+    for entry in found:
+        print('Port ' + entry['port'] + '  Address ' + entry['address'] + '  Firmware ' + entry['firmware'])
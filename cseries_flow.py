@@ -0,0 +1,204 @@
+###################################################################################################################################################
+#  cseries_flow.py - Continuous flow with two Tricontinent cseries Syringe Pumps
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Delivers a steady flow in mL/min from two pumps taking turns. The flow rate is turned into a V top velocity
+#           through the pump's volume map (calibration curve), with start and cutoff velocity matched to it so the plunger moves at a
+#           constant speed. While one pump dispenses a stroke the other refills, switches to the outlet and stores its
+#           next stroke in its command buffer, the handover is then a single R frame sent on a fixed schedule.
+#           Stroke start times are counted from the start of the run rather than from the previous stroke, so host
+#           timing errors do not add up over long runs.
+#
+#           flow = cseries_flow_controller([cseries_DT('Pump A'), cseries_DT('Pump B')], ml_per_min = 2.5)
+#           flow.run(volume = 100)
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import threading
+
+from math import ceil, floor
+from time import monotonic, sleep
+
+from cseries_config import SETTING_RANGES
+from cseries_motion import MICROSTEP_SCALE
+
+###################################################################################################################################################
+# Constants
+
+#: Highest start velocity (v) and cutoff velocity (c) the pump takes
+MAX_START_VELO = SETTING_RANGES['start_velo'][1]
+MAX_CUTOFF_VELO = SETTING_RANGES['cutoff_velo'][1]
+
+#: Spare time a refill must leave inside one stroke (sec)
+REFILL_MARGIN = 0.2
+
+###################################################################################################################################################
+# Class Definitions
+
+class cseries_flow_controller(object):
+    """Class running two cseries_DT pumps as one continuous flow source
+
+        Args:
+            pumps: The two cseries_DT pumps, open and initialized, with the same syringe and step settings
+            ml_per_min: Target flow rate
+            stroke_ml: Volume of each stroke, default the full syringe
+            inlet, outlet: Valve letters to refill from and dispense to
+            refill_velo: Top velocity of the refill, default the configured top velocity
+
+        The rate actually delivered differs slightly from the target because V is a whole number,
+        it is given by actual_ml_per_min.
+        """
+    def __init__(self, pumps, ml_per_min, stroke_ml = None, inlet = 'I', outlet = 'O', refill_velo = None):
+        if len(pumps) != 2:
+            raise ValueError('Continuous flow needs exactly two pumps')
+        first, second = pumps
+        if ((first.max_steps, first.syringe_volume, first.incre_mode, first.volumes.curve) !=
+                (second.max_steps, second.syringe_volume, second.incre_mode, second.volumes.curve)):
+            raise ValueError('Both pumps need the same syringe volume, calibration, increment mode and stepping mode')
+        self.pumps = list(pumps)
+        self.inlet = inlet
+        self.outlet = outlet
+        self.refill_velo = refill_velo if refill_velo is not None else first.top_velo
+
+        self.stroke_ml = first.volumes.full_volume if stroke_ml is None else stroke_ml
+        if not 0 < self.stroke_ml <= first.volumes.full_volume:
+            raise ValueError('stroke_ml must be more than 0 and at most the syringe volume')
+        self.stroke_steps = first.volumes.steps(self.stroke_ml)
+        self.velo = flow_velocity(first, ml_per_min, self.stroke_ml)
+        self.start_velo = min(self.velo, MAX_START_VELO)
+        self.cutoff_velo = min(self.velo, MAX_CUTOFF_VELO)
+        self.stroke_time = first.motion.move_time(self.stroke_steps, self.start_velo, self.velo, self.cutoff_velo)
+        self.actual_ml_per_min = self.stroke_ml / self.stroke_time * 60
+
+        refill_time = (first.motion.move_time(self.stroke_steps, top_velo = self.refill_velo) +
+                       2 * first.motion.valve_time + REFILL_MARGIN)
+        if refill_time >= self.stroke_time:
+            raise ValueError('Flow rate too high, refilling takes ' + str(round(refill_time, 2)) +
+                             ' s but a stroke only lasts ' + str(round(self.stroke_time, 2)) + ' s')
+
+        # Run statistics
+        self.strokes = 0
+        self.delivered_ml = 0.0
+        self.max_late = 0.0         # Latest stroke start after its scheduled time (sec)
+        self.resyncs = 0            # Times the schedule was moved back after a stroke started too late
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def refill_program(self, stroke_steps = None):
+        """Program filling a pump for one stroke (default a full one) and leaving its valve on the outlet."""
+        stroke_steps = self.stroke_steps if stroke_steps is None else stroke_steps
+        return ([self.inlet, 'V', 'A', self.outlet], ['', self.refill_velo, stroke_steps, ''])
+
+    def stroke_program(self):
+        """Program of one dispense stroke at the flow velocity, stored ahead and run with R."""
+        return (['v', 'c', 'V', 'A'], [self.start_velo, self.cutoff_velo, self.velo, 0])
+
+    def prepare(self, pump, stroke_ml = None):
+        """Refills pump with stroke_ml (default a full stroke) and stores its next stroke,
+            called while the other pump dispenses."""
+        pump.wait4idle(pump.pump_address)
+        pump.send_cmd_multi(*self.refill_program(None if stroke_ml is None else pump.volumes.steps(stroke_ml)))
+        pump.wait4idle(pump.pump_address)
+        if not pump.load_cmd_multi(*self.stroke_program()):
+            raise RuntimeError('Pump ' + pump.config.name + ' did not take the stroke program: ' +
+                               repr(pump.read_text_bytes))
+
+    def run(self, volume = None, duration = None):
+        """Runs the flow until volume mL were delivered, duration seconds passed or stop() is called.
+            Blocks, returns the volume delivered. With neither limit it runs until stop().
+            A volume that is not a whole number of strokes ends with a shorter stroke.
+            The pumps get their configured velocities back when the run ends, also after an error."""
+        limit = None
+        last_ml = self.stroke_ml
+        if volume is not None:
+            limit = floor(volume / self.stroke_ml + 1e-9)
+            rest = volume - limit * self.stroke_ml
+            if self.pumps[0].volumes.steps(rest) > 0:
+                limit += 1
+                last_ml = rest
+        if duration is not None:
+            by_time = ceil(duration / self.stroke_time - 1e-9)
+            if limit is None or by_time < limit:
+                limit = by_time
+                last_ml = self.stroke_ml
+        self.stopping.clear()
+        self.strokes = 0
+        self.delivered_ml = 0.0
+
+        def stroke_ml(stroke):
+            return last_ml if limit is not None and stroke == limit - 1 else self.stroke_ml
+
+        try:
+            for stroke, pump in enumerate(self.pumps):
+                if limit is None or stroke < limit:
+                    self.prepare(pump, stroke_ml(stroke))
+            lead = self.pumps[0].bus.char_time(len(self.pumps[0].handle.frames.execute))
+            origin = monotonic()
+            stroke = 0
+            while not self.stopping.is_set() and (limit is None or stroke < limit):
+                pump = self.pumps[stroke % 2]
+                start = origin + stroke * self.stroke_time - lead
+                remaining = start - monotonic()
+                if remaining > 0:
+                    sleep(remaining)
+                late = monotonic() - start
+                pump.run_loaded()
+                self.strokes += 1
+                self.delivered_ml += stroke_ml(stroke)
+                self.max_late = max(self.max_late, late)
+                if late > REFILL_MARGIN:
+                    origin += late      # The pump started late and runs at a fixed speed, keep the others after it
+                    self.resyncs += 1
+                stroke += 1
+                if self.stopping.is_set() or (limit is not None and stroke >= limit):
+                    break
+                other = self.pumps[stroke % 2]
+                if stroke > 1:
+                    self.prepare(other, stroke_ml(stroke))     # Finished the stroke before this one, refill it for the next
+        finally:
+            for pump in self.pumps:
+                self.finish(pump)
+        return self.delivered_ml
+
+    def finish(self, pump):
+        """Waits for pump, empties its command buffer and puts back its configured velocities."""
+        pump.wait4idle(pump.pump_address)
+        if pump.loaded is not None:
+            pump.unload()       # A stroke left in the buffer would run on the next R or group execute
+        pump.send_cmd_multi(['V', 'v', 'c'], [pump.top_velo, pump.start_velo, pump.cutoff_velo])
+        pump.wait4idle(pump.pump_address)
+
+    def start(self, volume = None, duration = None):
+        """Runs the flow in a background thread."""
+        self.thread = threading.Thread(target = self.run, args = (volume, duration), daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops after the stroke running now, both pumps are idle with empty command buffers and their
+            configured velocities when this returns."""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+###################################################################################################################################################
+# Functions
+
+def flow_velocity(pump, ml_per_min, stroke_ml = None):
+    """Returns the top velocity V that moves pump's plunger at ml_per_min, on average over a stroke of stroke_ml
+        (default the full syringe) emptying the syringe. Volumes are converted with pump.volumes."""
+    if ml_per_min <= 0:
+        raise ValueError('ml_per_min must be positive')
+    if stroke_ml is None:
+        stroke_ml = pump.volumes.full_volume
+    steps_per_sec = ml_per_min / 60 * pump.volumes.steps(stroke_ml) / stroke_ml
+    if pump.incre_mode == 1:
+        steps_per_sec /= MICROSTEP_SCALE    # Velocities are set in full step units in microstep mode
+    velo = int(round(steps_per_sec))
+    low, high = SETTING_RANGES['top_velo']
+    if not low <= velo <= high:
+        raise ValueError(str(ml_per_min) + ' mL/min needs V ' + str(velo) + ', outside ' + str(low) + '-' + str(high))
+    return velo
@@ -0,0 +1,233 @@
+###################################################################################################################################################
+#  cseries_jobs.py - Job queue and scheduler for many Tricontinent cseries Syringe Pumps
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Callers submit dispense, aspirate, valve and prime jobs aimed at named pumps and get a future back for each.
+#           Every job is sent as one Data Terminal program, so the bus is only needed to start a job and to see it
+#           finish. One dispatcher thread per port starts the next job of every idle pump and checks busy pumps only
+#           once their predicted move time has passed, so pump 2's move goes out while pump 1 is still moving and
+#           throughput grows with the number of pumps. A job can wait on other jobs' futures with after.
+#
+#           with cseries_scheduler([cseries_DT('Tecan'), cseries_DT('TriCont')]) as jobs:
+#               fill = jobs.aspirate('Tecan', 0.5)
+#               jobs.dispense('TriCont', 1.0)
+#               jobs.valve('Tecan', 'Outlet', after = [fill])
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import itertools
+import threading
+
+from collections import deque
+from concurrent.futures import Future
+from time import monotonic
+
+from tricont_cseries_DT_Driver import cseries_Status, cseries_idle_wait, Valve_Pos, MAX_LOOP_COUNT, CMD_REPORT_PLUNGER_POSITION
+
+###################################################################################################################################################
+# Constants
+
+JOB_KINDS = ('dispense', 'aspirate', 'valve', 'prime')
+
+###################################################################################################################################################
+# Class Definitions
+
+class cseries_job_error(RuntimeError):
+    """Raised through a job's future when the pump rejects or loses the job, or a job it waits on failed"""
+
+class cseries_job(object):
+    """One job for one pump, a single program the pump runs from start to idle
+
+        The future's result is the job itself, with started and finished monotonic times filled in.
+        """
+    _ids = itertools.count(1)
+
+    def __init__(self, pump_name, kind, args, after = ()):
+        if kind not in JOB_KINDS:
+            raise ValueError('Unknown job kind ' + repr(kind) + ', use one of ' + ', '.join(JOB_KINDS))
+        self.id = next(self._ids)
+        self.pump_name = pump_name
+        self.kind = kind
+        self.args = args
+        self.after = list(after)
+        self.future = Future()
+        self.started = None
+        self.finished = None
+
+    def __repr__(self):
+        return 'cseries_job(' + str(self.id) + ', ' + self.pump_name + ', ' + self.kind + str(self.args) + ')'
+
+    @property
+    def ready(self):
+        return all(future.done() for future in self.after)
+
+    def failed_dependency(self):
+        """Returns the first job waited on that was cancelled or failed, None if none did."""
+        for future in self.after:
+            if future.cancelled() or future.exception() is not None:
+                return future
+        return None
+
+    def program(self, pump):
+        """Returns the (commands, operands) program of this job for pump."""
+        if self.kind == 'dispense':
+            return pump.compile_disp_ml(*self.args)
+        if self.kind == 'aspirate':
+            volume, = self.args
+            if pump.state.plunger is None:
+                pump.send_cmd(CMD_REPORT_PLUNGER_POSITION, None)     # Position unknown, ask the pump
+            start = pump.state.plunger
+            if start is None:
+                raise cseries_job_error('Plunger position of ' + self.pump_name + ' is unknown')
+            steps = pump.volumes.steps(pump.volumes.volumes(start) + volume) - start
+            if volume < 0 or not pump.volumes.in_range(start + steps):
+                raise cseries_job_error('Aspirating ' + str(volume) + ' mL does not fit in the syringe of ' + self.pump_name)
+            return ['I', 'P'], ['', str(steps)]
+        if self.kind == 'valve':
+            position, = self.args
+            letter = Valve_Pos.get(position, position)
+            if letter not in Valve_Pos.values():
+                raise cseries_job_error('Unknown valve position ' + repr(position))
+            return [letter], ['']
+        cycles, = self.args     # prime
+        if not 1 <= cycles <= MAX_LOOP_COUNT:
+            raise cseries_job_error('Prime cycles must be 1-' + str(MAX_LOOP_COUNT))
+        return ['I', 'A', 'g', 'I', 'A', 'O', 'A', 'G'], ['', '0', '', '', str(pump.max_steps), '', '0', str(cycles)]
+
+class cseries_scheduler(object):
+    """Class dispatching jobs to cseries_DT pumps, one dispatcher thread per port
+
+        Args:
+            pumps: cseries_DT pumps, open and configured, addressed by their config name
+
+        Jobs for one pump run in the order they were submitted, a job that waits on others
+        holds back the jobs behind it on the same pump.
+        """
+    def __init__(self, pumps):
+        self.pumps = {pump.config.name : pump for pump in pumps}
+        self.queues = {name : deque() for name in self.pumps}
+        self.active = {}        # Pump name to (job, next poll time, cseries_idle_wait)
+        self.ports = {}
+        for name, pump in self.pumps.items():
+            self.ports.setdefault(pump.pump_port, []).append(name)
+        self.condition = threading.Condition()
+        self.closing = False
+        self.threads = [threading.Thread(target = self.dispatch, args = (port, names), daemon = True,
+                                         name = 'cseries_scheduler ' + port) for port, names in self.ports.items()]
+        for thread in self.threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, pump_name, kind, *args, after = ()) -> Future:
+        """Queues a job and returns its future. after lists futures of jobs that have to finish first."""
+        if pump_name not in self.pumps:
+            raise cseries_job_error("Pump '" + str(pump_name) + "' is not on this scheduler")
+        job = cseries_job(pump_name, kind, args, after)
+        with self.condition:
+            if self.closing:
+                raise cseries_job_error('Scheduler is closed')
+            self.queues[pump_name].append(job)
+            self.condition.notify_all()
+        for future in job.after:    # Wake the dispatchers when a job waited on finishes
+            future.add_done_callback(self._wake)
+        return job.future
+
+    def dispense(self, pump_name, volume, after = ()):
+        return self.submit(pump_name, 'dispense', volume, after = after)
+
+    def aspirate(self, pump_name, volume, after = ()):
+        return self.submit(pump_name, 'aspirate', volume, after = after)
+
+    def valve(self, pump_name, position, after = ()):
+        return self.submit(pump_name, 'valve', position, after = after)
+
+    def prime(self, pump_name, cycles = 3, after = ()):
+        return self.submit(pump_name, 'prime', cycles, after = after)
+
+    def close(self, wait = True):
+        """Stops taking jobs. With wait the queued jobs run first, otherwise they are cancelled."""
+        with self.condition:
+            self.closing = True
+            if not wait:
+                for queue in self.queues.values():
+                    while queue:
+                        queue.popleft().future.cancel()
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def _wake(self, future = None):
+        with self.condition:
+            self.condition.notify_all()
+
+    def dispatch(self, port, names):
+        """Dispatcher loop of one port."""
+        while True:
+            with self.condition:
+                if self.closing and not any(self.queues[name] or name in self.active for name in names):
+                    return
+                starts = [name for name in names if name not in self.active and self.queues[name] and self.queues[name][0].ready]
+            for name in starts:
+                self.start_job(name)
+            now = monotonic()
+            for name in names:
+                active = self.active.get(name)
+                if active is not None and active[1] <= now:
+                    self.poll_job(name)
+            with self.condition:
+                wake = [self.active[name][1] for name in names if name in self.active]
+                if any(name not in self.active and self.queues[name] and self.queues[name][0].ready for name in names):
+                    continue
+                if self.closing and not wake and not any(self.queues[name] for name in names):
+                    return
+                self.condition.wait(max(min(wake) - monotonic(), 0) if wake else None)
+
+    def start_job(self, name):
+        pump = self.pumps[name]
+        with self.condition:
+            job = self.queues[name].popleft()
+        if not job.future.set_running_or_notify_cancel():
+            return
+        failed = job.failed_dependency()
+        if failed is not None:
+            job.future.set_exception(cseries_job_error(repr(job) + ' waits on a job that did not finish'))
+            return
+        try:
+            commands, operands = job.program(pump)
+            job.started = monotonic()
+            pump.send_cmd_multi(commands, operands)
+        except Exception as error:
+            job.future.set_exception(error)
+            return
+        status = cseries_Status(pump.read_text_bytes)
+        if not pump.read_text_bytes or status.is_error:
+            job.future.set_exception(cseries_job_error(repr(job) + ' rejected by the pump: ' + status.record.message))
+            return
+        waiter = cseries_idle_wait(pump)
+        self.active[name] = (job, monotonic() + waiter.delay(), waiter)
+
+    def poll_job(self, name):
+        """Polls a busy pump once, with the prediction, lost poll limit, timeout and error handling of wait4idle."""
+        pump = self.pumps[name]
+        job, _, waiter = self.active[name]
+        try:
+            if not waiter.check(pump.bus.transact(pump.pump_address, waiter.frame)):
+                self.active[name] = (job, monotonic() + waiter.delay(), waiter)
+                return
+        except Exception as error:
+            del self.active[name]
+            failure = cseries_job_error(repr(job) + ' failed: ' + str(error))
+            failure.__cause__ = error
+            job.future.set_exception(failure)
+            return
+        del self.active[name]
+        job.finished = monotonic()
+        job.future.set_result(job)
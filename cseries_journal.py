@@ -0,0 +1,253 @@
+###################################################################################################################################################
+#  cseries_journal.py - Frame journal and replay for the Tricontinent cseries Data Terminal driver
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Records every frame sent and received on every bus to an append-only binary file, with a monotonic
+#           timestamp, port, address and direction, so a slow or failed run can be reconstructed afterwards.
+#           Frames are kept as they were on the wire (OEM packets with every repeat), replies that came late or for
+#           no request included. The file is unbuffered, each record is on disk once written, even after a crash.
+#           The journal is an instrumentation hook (see cseries_metrics) and costs nothing while it is off.
+#           The reader streams records one at a time. The replay runs a recorded session against stand-in ports that
+#           answer with the recorded replies after the recorded latency, so a regression can be reproduced offline.
+#
+#           journal = enable_journal('run.csj')
+#           ...
+#           disable_journal(journal)
+#
+#           python cseries_journal.py dump run.csj
+#           python cseries_journal.py replay run.csj --speed 1
+#
+#           File format: the magic bytes CSJ1, then records of a 14 byte little endian header
+#           (time double, kind byte, address byte, port index ushort, data length ushort) and the data.
+#           Kinds: 0 frame sent, 1 frame received, 2 port name for a port index, 3 session start (wall clock time),
+#           4 frame received after its request timed out or for no request (address 0 when unmatched).
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import argparse
+import struct
+import threading
+
+from collections import namedtuple, deque
+from pathlib import Path
+from time import monotonic, sleep, strftime
+
+from tricont_cseries_DT_Driver import cseries_bus
+from cseries_metrics import cseries_hook, add_hook, remove_hook
+from cseries_sim import cseries_sim_serial
+
+###################################################################################################################################################
+# Constants
+
+JOURNAL_MAGIC = b'CSJ1'
+RECORD_HEADER = struct.Struct('<dBBHH')
+
+KIND_SENT = 0
+KIND_RECEIVED = 1
+KIND_PORT = 2
+KIND_SESSION = 3
+KIND_LATE = 4
+
+#: Record kind of each on_wire direction
+WIRE_KINDS = {'sent' : KIND_SENT, 'reply' : KIND_RECEIVED, 'late' : KIND_LATE}
+
+#: Extra reply timeout given to replayed frames on top of the recorded latency (sec)
+REPLAY_TIMEOUT_MARGIN = 0.05
+
+###################################################################################################################################################
+# Class Definitions
+
+#: One journal record, port is the port name and address the address character ('' for port and session records)
+cseries_journal_record = namedtuple('cseries_journal_record', ['time', 'kind', 'port', 'address', 'data'])
+
+#: One recorded request with its reply, reply is b'' and latency None when no reply came
+cseries_exchange = namedtuple('cseries_exchange', ['time', 'port', 'address', 'frame', 'reply', 'latency'])
+
+class cseries_journal(cseries_hook):
+    """Hook appending every frame sent and received to a journal file, unbuffered so no record waits in memory"""
+    def __init__(self, journal_file):
+        self.path = Path(journal_file)
+        self.lock = threading.Lock()
+        self.file = self.path.open('ab', buffering = 0)
+        if self.file.tell() == 0:
+            self.file.write(JOURNAL_MAGIC)
+        self.ports = {}
+        self.records = 0
+        self._write(monotonic(), KIND_SESSION, 0, 0, strftime('%Y-%m-%dT%H:%M:%S').encode())
+
+    def _write(self, time, kind, address, port_index, data):
+        self.file.write(RECORD_HEADER.pack(time, kind, address, port_index, len(data)) + data)
+        self.records += 1
+
+    def on_wire(self, port, address, data, direction):
+        now = monotonic()
+        with self.lock:
+            if self.file.closed:
+                return
+            port_index = self.ports.get(port)
+            if port_index is None:
+                port_index = self.ports[port] = len(self.ports)
+                self._write(now, KIND_PORT, 0, port_index, str(port).encode())
+            address_byte = ord(str(address)[0]) if str(address) else 0
+            self._write(now, WIRE_KINDS[direction], address_byte, port_index, bytes(data))
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class cseries_replay_serial(cseries_sim_serial):
+    """Stand-in port answering each frame with the reply recorded for it, after the recorded latency
+
+        Replies are matched to frames in recorded order, a frame with no recorded reply gets none.
+        """
+    def __init__(self, port, exchanges, speed = 1.0):
+        super().__init__(port, line_delay = False)
+        self.speed = speed
+        self.recorded = {}
+        for exchange in exchanges:
+            self.recorded.setdefault(exchange.frame, deque()).append(exchange)
+        self.unknown_frames = 0     # Frames sent that were not in the recording
+
+    def _frame(self, frame, now):
+        self.frames_received += 1
+        queue = self.recorded.get(frame)
+        if not queue:
+            self.unknown_frames += 1
+            return
+        exchange = queue.popleft()
+        if exchange.reply:
+            self._pending.append((now + exchange.latency / self.speed, exchange.reply))
+            self._pending.sort(key = lambda item: item[0])
+
+###################################################################################################################################################
+# Functions
+
+def enable_journal(journal_file):
+    """Starts journaling every bus to journal_file (appended to), returns the journal."""
+    return add_hook(cseries_journal(journal_file))
+
+def disable_journal(journal):
+    remove_hook(journal)
+    journal.close()
+
+def read_journal(journal_file):
+    """Yields the records of a journal one at a time, without reading the whole file."""
+    with Path(journal_file).open('rb') as file:
+        if file.read(len(JOURNAL_MAGIC)) != JOURNAL_MAGIC:
+            raise ValueError(str(journal_file) + ' is not a cseries frame journal')
+        ports = {}
+        while True:
+            header = file.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return      # End of file, or a record cut short by a crash
+            time, kind, address, port_index, length = RECORD_HEADER.unpack(header)
+            data = file.read(length)
+            if len(data) < length:
+                return
+            if kind == KIND_SESSION:
+                ports = {}
+            elif kind == KIND_PORT:
+                ports[port_index] = data.decode(errors = 'replace')
+            yield cseries_journal_record(time, kind, ports.get(port_index, ''), chr(address) if address else '', data)
+
+def read_exchanges(journal_file, session = None):
+    """Yields the recorded exchanges of a journal, of every session or only the given one (0 is the first, -1 the last).
+        Each reply is paired with the request pending on its own port, exchanges come out as their replies arrive."""
+    if session is not None and session < 0:
+        sessions = sum(1 for record in read_journal(journal_file) if record.kind == KIND_SESSION)
+        session += sessions
+    current = -1
+    pending = {}    # Port to its request still waiting for a reply, replies are matched per port
+    for record in read_journal(journal_file):
+        if record.kind == KIND_SESSION:
+            current += 1
+            for sent in pending.values():
+                yield sent
+            pending = {}
+        if session is not None and current != session:
+            continue
+        if record.kind == KIND_SENT:
+            if record.port in pending:
+                yield pending[record.port]
+            pending[record.port] = cseries_exchange(record.time, record.port, record.address, record.data, b'', None)
+        elif record.kind in (KIND_RECEIVED, KIND_LATE) and record.port in pending:
+            sent = pending[record.port]
+            if record.kind == KIND_LATE and record.address != sent.address:
+                continue    # Unmatched, or the late answer to an earlier request
+            del pending[record.port]
+            yield sent._replace(reply = record.data, latency = record.time - sent.time)
+    for sent in pending.values():
+        yield sent
+
+def replay(journal_file, session = -1, speed = 1.0):
+    """Replays a recorded session through the driver against stand-in ports.
+        Frames go out with their recorded spacing divided by speed, or back to back when speed is None.
+        Returns a summary comparing the recorded and replayed run."""
+    exchanges = sorted(read_exchanges(journal_file, session), key = lambda exchange: exchange.time)
+    if not exchanges:
+        raise ValueError('No frames recorded in ' + str(journal_file))
+    by_port = {}
+    for exchange in exchanges:
+        by_port.setdefault(exchange.port, []).append(exchange)
+    stand_ins = {port: cseries_replay_serial(port, items, speed or 1.0) for port, items in by_port.items()}
+    buses = {port: cseries_bus.attach(port, stand_in) for port, stand_in in stand_ins.items()}
+    for bus in buses.values():
+        bus.open()
+    first = exchanges[0].time
+    results = {port: {'frames': 0, 'mismatched': 0, 'missing': 0} for port in by_port}
+
+    def drive(port):
+        bus = buses[port]
+        result = results[port]
+        for exchange in by_port[port]:
+            if speed:
+                remaining = origin + (exchange.time - first) / speed - monotonic()
+                if remaining > 0:
+                    sleep(remaining)
+            timeout = (exchange.latency or 0) / (speed or 1.0) + REPLAY_TIMEOUT_MARGIN if exchange.reply else None
+            reply = bus.transact(exchange.address, exchange.frame, timeout)
+            result['frames'] += 1
+            if exchange.reply and not reply:
+                result['missing'] += 1
+            elif reply != exchange.reply:
+                result['mismatched'] += 1
+
+    origin = monotonic()
+    threads = [threading.Thread(target = drive, args = (port,)) for port in by_port]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    replayed = monotonic() - origin
+    for bus in buses.values():
+        bus.close()
+    recorded = max(exchange.time + (exchange.latency or 0) for exchange in exchanges) - first
+    return {'frames': len(exchanges), 'recorded_seconds': recorded, 'replay_seconds': replayed,
+            'speed': speed, 'ports': results}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Show or replay a cseries frame journal')
+    parser.add_argument('action', choices = ['dump', 'replay'])
+    parser.add_argument('journal')
+    parser.add_argument('--session', type = int, default = -1, help = 'Session to replay, -1 is the last')
+    parser.add_argument('--speed', type = float, default = 1.0, help = 'Replay speed, 0 sends frames back to back')
+    args = parser.parse_args()
+    if args.action == 'dump':
+        names = {KIND_SENT: '->', KIND_RECEIVED: '<-', KIND_PORT: 'port', KIND_SESSION: 'session', KIND_LATE: 'late'}
+        for record in read_journal(args.journal):
+            print('%12.6f %-7s %-14s %1s %r' % (record.time, names.get(record.kind, record.kind), record.port,
+                                                record.address, record.data))
+    else:
+        summary = replay(args.journal, args.session, args.speed or None)
+        print('Replayed ' + str(summary['frames']) + ' frames in ' + str(round(summary['replay_seconds'], 3)) +
+              ' s, recorded ' + str(round(summary['recorded_seconds'], 3)) + ' s')
+        for port, result in summary['ports'].items():
+            print(port + ': ' + str(result['frames']) + ' frames, ' + str(result['missing']) + ' replies missing, ' +
+                  str(result['mismatched']) + ' replies different')
@@ -0,0 +1,175 @@
+###################################################################################################################################################
+#  cseries_library.py - Stored program library for Tricontinent cseries Syringe Pumps
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Keeps named Data Terminal programs (priming loops, wash cycles, ...) and stores each one once in a slot of
+#           the pump's non volatile program storage (s<slot><program>). Later runs send only e<slot>, a 6 byte frame
+#           instead of the whole program. Which version of which program every pump holds is kept in a manifest file
+#           by program hash, so a changed program is stored again the next time it runs and an unchanged one never is,
+#           across runs of the script. The storage survives power cycles but wears with writes, so it is only written
+#           when the manifest says the pump holds something else.
+#
+#           library = cseries_program_library()
+#           library.add('prime', ['g','I','A','O','A','G'], ['','','3000','','0','25'])
+#           library.run(pump, 'prime')
+#           pump.wait4idle(pump.pump_address)
+#
+#           The manifest can not see a pump that was swapped or had its storage written by other software,
+#           use forget(pump) or upload(pump, name, force = True) then.
+#
+#  Refrences:
+#       Tricontent CSeries User manual - c-series-manual.pdf
+#           See the program storage commands (s, e) in the Data Terminal command set
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import hashlib
+import json
+import threading
+
+from collections import namedtuple
+from itertools import zip_longest
+from pathlib import Path
+from time import strftime
+
+from tricont_cseries_DT_Driver import (cseries_Status, cseries_pump_error, cseries_timeout_error, CMD_STORE_PROGRAM,
+                                       CMD_RUN_STORED_PROGRAM, STORED_PROGRAM_SLOTS)
+
+###################################################################################################################################################
+# Constants
+
+#: File recording which program version every pump holds in each slot
+PROGRAM_MANIFEST_FILE = Path(__file__).with_name('cseries_programs.json')
+
+###################################################################################################################################################
+# Class Definitions
+
+#: One library program, text is the program as sent and digest the hash the manifest keeps for it
+cseries_stored_program = namedtuple('cseries_stored_program', ['name', 'slot', 'commands', 'operands', 'text', 'digest'])
+
+class cseries_program_library(object):
+    """Class keeping named programs and uploading each one once into every pump that runs it
+
+        Args:
+            manifest_file: JSON file recording the program held in each slot of each pump, by pump config name
+        """
+    def __init__(self, manifest_file = PROGRAM_MANIFEST_FILE):
+        self.manifest_file = Path(manifest_file)
+        self.manifest = load_manifest(self.manifest_file)
+        self.programs = {}
+        self.lock = threading.Lock()
+        self.uploads = 0
+
+    def add(self, name, commands, operands, slot = None):
+        """Adds a program under name in slot (default the lowest slot no other program uses), returns it.
+            Adding a name again replaces its program, the pumps get the new one the next time it runs."""
+        text = program_text(commands, operands)
+        if not text or text[:1] in (CMD_STORE_PROGRAM, CMD_RUN_STORED_PROGRAM):
+            raise ValueError('Program ' + repr(name) + ' can not be stored: ' + repr(text))
+        with self.lock:
+            used = {program.slot : program.name for program in self.programs.values() if program.name != name}
+            if slot is None:
+                current = self.programs.get(name)
+                free = [index for index in range(STORED_PROGRAM_SLOTS) if index not in used]
+                if current is not None and current.slot not in used:
+                    slot = current.slot
+                elif free:
+                    slot = free[0]
+                else:
+                    raise ValueError('No free program slot for ' + repr(name))
+            elif not 0 <= slot < STORED_PROGRAM_SLOTS:
+                raise ValueError('Program slot must be 0-' + str(STORED_PROGRAM_SLOTS - 1))
+            elif slot in used:
+                raise ValueError('Slot ' + str(slot) + ' already holds ' + repr(used[slot]))
+            program = cseries_stored_program(name, slot, list(commands), [str(op) if op is not None else '' for op in operands],
+                                             text, hashlib.sha1(text.encode()).hexdigest()[:16])
+            self.programs[name] = program
+        return program
+
+    def get(self, name):
+        program = self.programs.get(name)
+        if program is None:
+            raise KeyError('No program ' + repr(name) + ' in the library')
+        return program
+
+    def held(self, pump):
+        """Returns {slot: {'name', 'digest'}} the manifest records for pump."""
+        return self.manifest.get(pump.config.name, {})
+
+    def is_current(self, pump, name):
+        """True if the manifest says pump holds this version of the program in its slot."""
+        program = self.get(name)
+        entry = self.held(pump).get(str(program.slot))
+        return entry is not None and entry['digest'] == program.digest
+
+    def upload(self, pump, name, force = False):
+        """Stores the program in pump unless it already holds this version, returns True if it was stored."""
+        if not force and self.is_current(pump, name):
+            return False
+        pump.wait_until_ready([CMD_STORE_PROGRAM])      # The pump ignores programs while it is busy
+        self._store(pump, self.get(name))
+        return True
+
+    def upload_all(self, pump, force = False):
+        """Stores every library program pump does not hold yet, returns the names stored.
+            The pump is waited for once, before the first program."""
+        names = [name for name in list(self.programs) if force or not self.is_current(pump, name)]
+        if names:
+            pump.wait_until_ready([CMD_STORE_PROGRAM])
+        for name in names:
+            self._store(pump, self.get(name))
+        return names
+
+    def _store(self, pump, program):
+        """Sends the s<slot> frame of program to an idle pump and records it in the manifest."""
+        name = program.name
+        frame = pump.handle.frames.program([CMD_STORE_PROGRAM + str(program.slot)] + program.commands,
+                                           [''] + program.operands)
+        reply = pump.handle.transact(frame)
+        pump.read_text_bytes = reply
+        status = cseries_Status(reply)
+        if not reply:
+            raise cseries_timeout_error('Pump ' + pump.config.name + ' did not answer storing ' + repr(name), pump.config.name)
+        if status.is_error or status.status_BusyOrIdle == 'Busy':     # Busy, the frame was ignored
+            raise cseries_pump_error('Pump ' + pump.config.name + ' refused to store ' + repr(name) + ': ' +
+                                     status.status_message, pump.config.name, status)
+        with self.lock:
+            self.manifest.setdefault(pump.config.name, {})[str(program.slot)] = {'name' : name, 'digest' : program.digest}
+            self.uploads += 1
+            save_manifest(self.manifest, self.manifest_file)
+
+    def run(self, pump, name):
+        """Runs a library program on pump with the short e<slot> frame, storing it first if the pump does not
+            hold this version. The move prediction, state cache and fault recovery work as for send_cmd_multi."""
+        program = self.get(name)
+        self.upload(pump, name)
+        pump.send_program(program.commands, program.operands,
+                          pump.handle.frames.frame(CMD_RUN_STORED_PROGRAM, program.slot))
+
+    def forget(self, pump):
+        """Drops what the manifest records for pump, every program is stored again the next time it runs."""
+        with self.lock:
+            if self.manifest.pop(pump.config.name, None) is not None:
+                save_manifest(self.manifest, self.manifest_file)
+
+###################################################################################################################################################
+# Functions
+
+def program_text(commands, operands):
+    """Program as it goes on the wire, commands and operands paired as in send_cmd_multi."""
+    return ''.join(str(cmd) + ('' if op is None else str(op)) for cmd, op in zip_longest(commands, operands, fillvalue = ''))
+
+def load_manifest(manifest_file = PROGRAM_MANIFEST_FILE):
+    """Returns {pump name: {slot: {'name', 'digest'}}} from the manifest, empty when there is none."""
+    try:
+        with Path(manifest_file).open('r') as file:
+            return json.load(file)['pumps']
+    except (OSError, ValueError, KeyError):
+        return {}
+
+def save_manifest(manifest, manifest_file = PROGRAM_MANIFEST_FILE):
+    with Path(manifest_file).open('w') as file:
+        json.dump({'saved': strftime('%Y-%m-%dT%H:%M:%S'), 'pumps': manifest}, file, indent = 2)
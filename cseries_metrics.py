@@ -0,0 +1,205 @@
+###################################################################################################################################################
+#  cseries_metrics.py - Instrumentation for the Tricontinent cseries Data Terminal driver
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Collects where time goes inside send_cmd, send_cmd_multi, wait4idle and disp_ml. Every bus transaction
+#           reports its serial write and read time, command letter, pump and reply to the hooks in
+#           INSTRUMENT_HOOKS, every wait4idle reports its polls and busy time. cseries_metrics is a hook keeping
+#           latency histograms per command letter and per pump, serial time, timeout counts and error status counts
+#           by STATUS_DICT key, exported as Prometheus text or CSV. With no hook added the driver skips all timing.
+#
+#           metrics = enable_metrics()
+#           pump.disp_ml(1.0)
+#           print(metrics.prometheus_text())
+#           metrics.to_csv('metrics.csv')
+#           disable_metrics(metrics)
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import csv
+import threading
+
+from bisect import bisect_left
+from pathlib import Path
+
+from tricont_cseries_DT_Driver import INSTRUMENT_HOOKS, STATUS_TABLE
+
+###################################################################################################################################################
+# Constants
+
+#: Upper bounds of the latency histogram buckets (sec), a frame at 9600 baud takes about 14 ms
+LATENCY_BUCKETS = (0.002, 0.005, 0.01, 0.015, 0.02, 0.03, 0.05, 0.1, 0.2, 0.5, 1.0)
+#: Upper bounds of the wait4idle histogram buckets (sec)
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+###################################################################################################################################################
+# Class Definitions
+
+class cseries_hook(object):
+    """Base class of instrumentation hooks, override the calls needed
+
+        on_transact: port, address, frame sent, reply (b'' on timeout), serial write and read time (sec)
+        on_wire: port, address, bytes as written or read ('sent', 'reply' or 'late' for a frame that came after its
+                 request timed out or matched no request, address '' when unmatched). OEM packets are given as sent,
+                 with every repeat, on_transact gets them in Data Terminal form.
+        on_wait: pump name, port, address, status polls and total time of one wait4idle (sec)
+        Hooks are called on the thread using the bus, with the bus held, so they should return quickly.
+        """
+    def on_transact(self, port, address, frame, reply, write_time, read_time):
+        pass
+
+    def on_wire(self, port, address, data, direction):
+        pass
+
+    def on_wait(self, pump_name, port, address, polls, seconds):
+        pass
+
+class cseries_histogram(object):
+    """Fixed bucket histogram with Prometheus style cumulative export"""
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # Last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Returns (upper bound, count of values at or below it) pairs, the last bound is '+Inf'."""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+class cseries_metrics(cseries_hook):
+    """Hook collecting latency, serial time, timeout, status and wait metrics"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.command_latency = {}   # (port, address, command letter) to histogram of round trip time
+            self.write_seconds = {}     # port to total serial write time
+            self.read_seconds = {}      # port to total time waiting for and reading replies
+            self.frames = {}            # (port, address) to frames sent
+            self.timeouts = {}          # (port, address) to replies that never came
+            self.statuses = {}          # (port, address, STATUS_DICT key) to error replies
+            self.wait_time = {}         # pump name to histogram of wait4idle time
+            self.wait_polls = {}        # pump name to status polls made by wait4idle
+
+    def on_transact(self, port, address, frame, reply, write_time, read_time):
+        command = chr(frame[2]) if len(frame) > 3 else ''
+        key = (port, str(address))
+        with self.lock:
+            histogram = self.command_latency.get(key + (command,))
+            if histogram is None:
+                histogram = self.command_latency[key + (command,)] = cseries_histogram(LATENCY_BUCKETS)
+            histogram.observe(write_time + read_time)
+            self.write_seconds[port] = self.write_seconds.get(port, 0.0) + write_time
+            self.read_seconds[port] = self.read_seconds.get(port, 0.0) + read_time
+            self.frames[key] = self.frames.get(key, 0) + 1
+            if not reply:
+                self.timeouts[key] = self.timeouts.get(key, 0) + 1
+                return
+            start = reply.find(b'/')
+            if 0 <= start < len(reply) - 2:
+                record = STATUS_TABLE[reply[start + 2]]
+                if record.error:
+                    status_key = key + (record.key or 'UNKNOWN',)
+                    self.statuses[status_key] = self.statuses.get(status_key, 0) + 1
+
+    def on_wait(self, pump_name, port, address, polls, seconds):
+        with self.lock:
+            histogram = self.wait_time.get(pump_name)
+            if histogram is None:
+                histogram = self.wait_time[pump_name] = cseries_histogram(WAIT_BUCKETS)
+            histogram.observe(seconds)
+            self.wait_polls[pump_name] = self.wait_polls.get(pump_name, 0) + polls
+
+    def rows(self):
+        """Returns every value as (metric, labels dict, value) rows, histograms as _bucket, _sum and _count rows."""
+        rows = []
+        with self.lock:
+            for (port, address, command), histogram in sorted(self.command_latency.items()):
+                _histogram_rows(rows, 'cseries_command_seconds', {'port': port, 'address': address, 'command': command}, histogram)
+            for port, seconds in sorted(self.write_seconds.items()):
+                rows.append(('cseries_serial_write_seconds_total', {'port': port}, seconds))
+            for port, seconds in sorted(self.read_seconds.items()):
+                rows.append(('cseries_serial_read_seconds_total', {'port': port}, seconds))
+            for (port, address), count in sorted(self.frames.items()):
+                rows.append(('cseries_frames_total', {'port': port, 'address': address}, count))
+            for (port, address), count in sorted(self.timeouts.items()):
+                rows.append(('cseries_reply_timeouts_total', {'port': port, 'address': address}, count))
+            for (port, address, status), count in sorted(self.statuses.items()):
+                rows.append(('cseries_error_status_total', {'port': port, 'address': address, 'status': status}, count))
+            for pump_name, histogram in sorted(self.wait_time.items()):
+                _histogram_rows(rows, 'cseries_wait4idle_seconds', {'pump': pump_name}, histogram)
+            for pump_name, polls in sorted(self.wait_polls.items()):
+                rows.append(('cseries_wait4idle_polls_total', {'pump': pump_name}, polls))
+        return rows
+
+    def prometheus_text(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        types = {'cseries_command_seconds': 'histogram', 'cseries_wait4idle_seconds': 'histogram'}
+        lines = []
+        declared = set()
+        for metric, labels, value in self.rows():
+            family = metric
+            for suffix in ('_bucket', '_sum', '_count'):
+                if metric.endswith(suffix) and metric[:-len(suffix)] in types:
+                    family = metric[:-len(suffix)]
+            if family not in declared:
+                declared.add(family)
+                lines.append('# TYPE ' + family + ' ' + types.get(family, 'counter'))
+            label_text = ','.join(name + '="' + _escape(str(text)) + '"' for name, text in labels.items())
+            lines.append(metric + ('{' + label_text + '}' if label_text else '') + ' ' + (str(value) if isinstance(value, int) else repr(float(value))))
+        return '\n'.join(lines) + '\n'
+
+    def to_csv(self, csv_file):
+        """Writes the metrics as CSV rows of metric, labels and value, returns the path."""
+        path = Path(csv_file)
+        with path.open('w', newline = '') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Metric', 'Labels', 'Value'])
+            for metric, labels, value in self.rows():
+                writer.writerow([metric, ';'.join(name + '=' + str(text) for name, text in labels.items()), value])
+        return path
+
+###################################################################################################################################################
+# Functions
+
+def add_hook(hook):
+    if hook not in INSTRUMENT_HOOKS:
+        INSTRUMENT_HOOKS.append(hook)
+    return hook
+
+def remove_hook(hook):
+    if hook in INSTRUMENT_HOOKS:
+        INSTRUMENT_HOOKS.remove(hook)
+
+def enable_metrics(metrics = None):
+    """Adds a cseries_metrics hook (a new one by default) and returns it."""
+    return add_hook(metrics if metrics is not None else cseries_metrics())
+
+def disable_metrics(metrics):
+    remove_hook(metrics)
+
+def _histogram_rows(rows, metric, labels, histogram):
+    for bound, count in histogram.cumulative():
+        rows.append((metric + '_bucket', dict(labels, le = str(bound)), count))
+    rows.append((metric + '_sum', labels, histogram.sum))
+    rows.append((metric + '_count', labels, histogram.count))
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,192 @@
+###################################################################################################################################################
+#  cseries_motion.py - Motion time prediction for Tricontinent cseries Syringe Pumps
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Predicts how long a plunger move or a Data Terminal program takes from the velocity profile settings
+#           (v start velocity, V top velocity, c cutoff velocity, L acceleration slope code) so the driver can sleep
+#           through a move instead of polling the bus for the whole of it
+#
+#  Refrences:
+#       Tricontent CSeries User manual - c-series-manual.pdf
+#           See Velocity and Acceleration commands (v, V, c, L) for the plunger velocity profile
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+from math import sqrt
+
+###################################################################################################################################################
+# Constants
+
+#: Acceleration added by each step of the L slope code (increments/sec^2)
+ACCEL_PER_SLOPE_CODE = 2500
+#: Steps per velocity increment in microstep mode (N1), velocities are always given in standard increments
+MICROSTEP_SCALE = 8
+#: Time to rotate the valve to a new port (sec)
+DEFAULT_VALVE_TIME = 0.25
+#: Time for an initialization command to finish (sec)
+DEFAULT_INIT_TIME = 6.0
+
+#: Time to wake up before the predicted end of a move (sec)
+DEFAULT_WAKE_MARGIN = 0.02
+#: Time before the wake up in which the pump is already polled, so a pump that finishes early is seen (sec)
+DEFAULT_EARLY_WINDOW = 0.5
+#: Poll interval inside the early window (sec)
+DEFAULT_POLL_EARLY = 0.1
+#: First poll interval after the predicted end of a move (sec)
+DEFAULT_POLL_MIN = 0.005
+#: Longest poll interval reached by the backoff (sec)
+DEFAULT_POLL_MAX = 0.05
+
+# Commands that move the plunger, rotate the valve or initialize the pump
+MOVE_CMDS = ('A', 'P', 'D')
+VALVE_CMDS = ('I', 'O', 'B', 'E')
+INIT_CMDS = ('Z', 'Y', 'W', 'w')
+
+###################################################################################################################################################
+# Class Definitions
+
+class cseries_motion_model(object):
+    """Class that predicts move times for one pump and keeps statistics on how good the predictions are
+
+        Velocities are in increments/sec, positions are in the pump's current step units.
+        """
+    def __init__(self, start_velo = 900, top_velo = 5600, cutoff_velo = 900, acc_slope = 14, microstep = False,
+                 valve_time = DEFAULT_VALVE_TIME, init_time = DEFAULT_INIT_TIME):
+        self.start_velo = int(start_velo)
+        self.top_velo = int(top_velo)
+        self.cutoff_velo = int(cutoff_velo)
+        self.acc_slope = int(acc_slope)
+        self.microstep = microstep
+        self.valve_time = valve_time
+        self.init_time = init_time
+
+        # Wait tuning
+        self.wake_margin = DEFAULT_WAKE_MARGIN
+        self.early_window = DEFAULT_EARLY_WINDOW
+        self.poll_early = DEFAULT_POLL_EARLY
+        self.poll_min = DEFAULT_POLL_MIN
+        self.poll_max = DEFAULT_POLL_MAX
+
+        # Wait statistics
+        self.waits = 0
+        self.polls = 0
+        self.last_polls = 0
+        self.predicted_waits = 0
+        self.last_error = None
+        self.abs_error_sum = 0.0
+
+    def move_time(self, steps, start_velo = None, top_velo = None, cutoff_velo = None, acc_slope = None):
+        """Returns the time in seconds to move the plunger by steps with a trapezoidal velocity profile."""
+        v_start = self.start_velo if start_velo is None else start_velo
+        v_top = self.top_velo if top_velo is None else top_velo
+        v_cut = self.cutoff_velo if cutoff_velo is None else cutoff_velo
+        accel = ACCEL_PER_SLOPE_CODE * (self.acc_slope if acc_slope is None else acc_slope)
+
+        distance = abs(steps) / (MICROSTEP_SCALE if self.microstep else 1)
+        if distance == 0:
+            return 0.0
+        v_top = max(v_top, 1)
+        v_start = min(v_start, v_top)
+        v_cut = min(v_cut, v_top)
+        if accel <= 0:
+            return distance / v_top
+
+        ramp_up = (v_top**2 - v_start**2) / (2 * accel)
+        ramp_down = (v_top**2 - v_cut**2) / (2 * accel)
+        if ramp_up + ramp_down <= distance:
+            return (v_top - v_start) / accel + (v_top - v_cut) / accel + (distance - ramp_up - ramp_down) / v_top
+
+        # Move too short to reach top velocity, triangular profile
+        v_peak = sqrt((2 * accel * distance + v_start**2 + v_cut**2) / 2)
+        if v_peak <= max(v_start, v_cut):
+            return distance / max(v_start, v_cut)
+        return (v_peak - v_start) / accel + (v_peak - v_cut) / accel
+
+    def estimate_program(self, commands, operands, start_steps = None, apply = False):
+        """Walks a command/operand program (g/G loops included) and predicts its run time.
+            Returns (seconds, end_steps), end_steps is None when the plunger position is unknown.
+            A G loop without a count repeats forever and gives an infinite time.
+            apply keeps any v/V/c/L changes made by the program as the new velocity settings."""
+        velo = {'v': self.start_velo, 'V': self.top_velo, 'c': self.cutoff_velo, 'L': self.acc_slope}
+        position = start_steps
+        seconds = 0.0
+        for cmd, value in walk_program(commands, operands):
+            if cmd in MOVE_CMDS and value is not None:
+                if cmd == 'A':
+                    target = value
+                    steps = 0 if position is None else target - position
+                elif cmd == 'P':
+                    steps = value
+                    target = None if position is None else position + value
+                else:
+                    steps = value
+                    target = None if position is None else position - value
+                seconds += self.move_time(steps, velo['v'], velo['V'], velo['c'], velo['L'])
+                position = target
+            elif cmd in VALVE_CMDS:
+                seconds += self.valve_time
+            elif cmd in INIT_CMDS:
+                seconds += self.init_time
+                position = 0
+            elif cmd == 'M' and value is not None:
+                seconds += value / 1000
+            elif cmd in velo and value is not None:
+                velo[cmd] = value
+            elif cmd == 'G':
+                return float('inf'), None
+
+        if apply:
+            self.start_velo, self.top_velo, self.cutoff_velo, self.acc_slope = velo['v'], velo['V'], velo['c'], velo['L']
+        return seconds, position
+
+    def record_wait(self, polls, predicted = None, actual = None):
+        """Records the poll count of one wait and, when there was a prediction, the error (actual - predicted).
+            actual is the time from the start of the move to the first poll that found the pump idle."""
+        self.waits += 1
+        self.polls += polls
+        self.last_polls = polls
+        if predicted is not None and actual is not None:
+            self.predicted_waits += 1
+            self.last_error = actual - predicted
+            self.abs_error_sum += abs(self.last_error)
+
+    def mean_polls(self):
+        return self.polls / self.waits if self.waits else 0.0
+
+    def mean_abs_error(self):
+        return self.abs_error_sum / self.predicted_waits if self.predicted_waits else 0.0
+
+def walk_program(commands, operands):
+    """Yields (command, value) in the order the pump runs a program, with g/G loops unrolled.
+        value is the integer operand or None. A G loop without a count repeats forever on the pump,
+        the walk yields that G and stops there."""
+    program = [(cmd, int(op) if op.lstrip('-').isdigit() else None) for cmd, op in _pair_up(commands, operands)]
+    loops = []
+    index = 0
+    while index < len(program):
+        cmd, value = program[index]
+        if cmd == 'g':
+            loops.append([index, None])
+        elif cmd == 'G' and loops:
+            if not value:
+                yield cmd, value
+                return
+            if loops[-1][1] is None:
+                loops[-1][1] = value
+            loops[-1][1] -= 1
+            if loops[-1][1] > 0:
+                index = loops[-1][0]
+            else:
+                loops.pop()
+        elif cmd != 'G':
+            yield cmd, value
+        index += 1
+
+def _pair_up(commands, operands):
+    """Pairs commands with their operands the way send_cmd_multi does, missing operands are ''."""
+    for index, cmd in enumerate(commands):
+        op = operands[index] if index < len(operands) and operands[index] is not None else ''
+        yield cmd, str(op)
@@ -0,0 +1,75 @@
+###################################################################################################################################################
+#  cseries_oem.py - OEM protocol framing for Tricontinent cseries Syringe Pumps
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Builds and checks OEM protocol packets. A packet is STX, the pump address, a sequence byte, the same
+#           command text as a Data Terminal frame, ETX and a checksum that XORs every byte before it. The sequence
+#           byte carries a 3 bit sequence number and a repeat bit, a packet sent again after a lost or damaged reply
+#           keeps its number and sets the repeat bit so the pump answers it without running the commands twice.
+#           Replies are turned back into Data Terminal form so the rest of the driver handles both protocols alike.
+#
+#  Refrences:
+#       Tricontent CSeries User manual - c-series-manual.pdf, OEM Communication Protocol
+#
+###################################################################################################################################################
+
+###################################################################################################################################################
+# Constants
+
+PROTOCOL_DT = 'DT'
+PROTOCOL_OEM = 'OEM'
+PROTOCOLS = (PROTOCOL_DT, PROTOCOL_OEM)
+
+STX = 0x02
+ETX = 0x03
+
+#: Sequence byte is 0b0011RSSS, R the repeat bit and SSS the sequence number 1-7
+SEQUENCE_BASE = 0x30
+REPEAT_BIT = 0x08
+SEQUENCE_MASK = 0x07
+
+#: Times a packet is sent again after no reply or a damaged one
+OEM_RETRIES = 3
+#: Reply timeout of one OEM attempt before the packet is repeated (sec), plus the transmission time
+OEM_REPLY_TIMEOUT = 0.03
+
+###################################################################################################################################################
+# Functions
+
+def checksum(data) -> int:
+    """XOR of every byte in data."""
+    value = 0
+    for byte in data:
+        value ^= byte
+    return value
+
+def next_sequence(sequence:int) -> int:
+    """Sequence number after sequence, cycling through 1-7."""
+    return sequence % SEQUENCE_MASK + 1
+
+def packet(address:str, sequence:int, body:bytes, repeat = False) -> bytes:
+    """Returns the OEM packet carrying the command text body (e.g. b'A3000R') to address."""
+    packet = bytearray((STX, ord(address), SEQUENCE_BASE | (REPEAT_BIT if repeat else 0) | sequence))
+    packet += body
+    packet.append(ETX)
+    packet.append(checksum(packet))
+    return bytes(packet)
+
+def dt_body(frame:bytes) -> bytes:
+    """Command text of a Data Terminal frame, the part between the address and the CR."""
+    return frame[2:-1] if frame[-1:] == b'\r' else frame[2:]
+
+def is_valid(data) -> bool:
+    """True if data is one complete OEM packet with a correct checksum."""
+    return (len(data) >= 5 and data[0] == STX and data[-2] == ETX and checksum(data[:-1]) == data[-1])
+
+def unpack(data):
+    """Returns (address, sequence byte, body) of a valid OEM packet."""
+    return chr(data[1]), data[2], bytes(data[3:-2])
+
+def reply_to_dt(data) -> bytes:
+    """Turns a valid OEM reply (STX '0' status data ETX checksum) into the Data Terminal reply form."""
+    return b'/' + bytes(data[1:-1]) + b'\r\n'
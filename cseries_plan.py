@@ -0,0 +1,206 @@
+###################################################################################################################################################
+#  cseries_plan.py - Dispense planning for Tricontinent cseries Syringe Pumps
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Turns a list of (volume, destination port) requests into the fewest aspirations and valve moves.
+#           Liquid already in the syringe is used first, each aspiration fills the syringe as far as the remaining
+#           requests need so one full syringe is split across several destinations, and the valve is only moved
+#           when the port changes. The plan carries a predicted time for every step from the pump's motion model and
+#           runs as whole Data Terminal programs, leaving the unused liquid in the syringe for the next plan.
+#
+#           plan = plan_dispense(pump, [(0.2, 'Outlet'), (0.3, 'Bypass'), (0.4, 'Extra')])
+#           print(plan.total_time, plan.aspirations, plan.valve_moves)
+#           plan.run(pump)
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+from collections import namedtuple
+from math import ceil
+
+from tricont_cseries_DT_Driver import Valve_Pos, CMD_REPORT_PLUNGER_POSITION, CMD_MOVE_TO
+
+###################################################################################################################################################
+# Constants
+
+#: Longest program text sent in one frame, longer plans are sent in parts
+MAX_PROGRAM_CHARS = 200
+#: Volume left of a request that counts as delivered, absorbs float rounding (mL)
+PLAN_TOLERANCE = 1e-9
+
+###################################################################################################################################################
+# Class Definitions
+
+#: One step of a plan. action is 'valve', 'aspirate' or 'dispense', port the valve letter, position the plunger
+#: position after the step, volume the mL moved, start and duration the predicted times (sec) from the plan start.
+cseries_plan_step = namedtuple('cseries_plan_step', ['action', 'port', 'position', 'volume', 'start', 'duration'])
+
+class cseries_dispense_plan(object):
+    """Class holding a timed plan of valve moves and plunger moves for one pump"""
+    def __init__(self, steps, start_position, start_valve):
+        self.steps = list(steps)
+        self.start_position = start_position
+        self.start_valve = start_valve
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    def __len__(self):
+        return len(self.steps)
+
+    @property
+    def total_time(self):
+        return self.steps[-1].start + self.steps[-1].duration if self.steps else 0.0
+
+    @property
+    def aspirations(self):
+        return sum(1 for step in self.steps if step.action == 'aspirate')
+
+    @property
+    def valve_moves(self):
+        return sum(1 for step in self.steps if step.action == 'valve')
+
+    @property
+    def end_position(self):
+        positions = [step.position for step in self.steps if step.position is not None]
+        return positions[-1] if positions else self.start_position
+
+    def program(self):
+        """Returns the whole plan as one (commands, operands) program."""
+        commands, operands = [], []
+        for step in self.steps:
+            if step.action == 'valve':
+                commands.append(step.port)
+                operands.append('')
+            else:
+                commands.append(CMD_MOVE_TO)
+                operands.append(str(step.position))
+        return commands, operands
+
+    def programs(self):
+        """Returns the plan split into programs no longer than MAX_PROGRAM_CHARS."""
+        parts = []
+        commands, operands, length = [], [], 0
+        for command, operand in zip(*self.program()):
+            size = len(command) + len(operand)
+            if commands and length + size > MAX_PROGRAM_CHARS:
+                parts.append((commands, operands))
+                commands, operands, length = [], [], 0
+            commands.append(command)
+            operands.append(operand)
+            length += size
+        if commands:
+            parts.append((commands, operands))
+        return parts
+
+    def run(self, pump, verbose = False):
+        """Runs the plan on pump and waits for it to finish."""
+        pump.wait4idle(pump.pump_address)
+        for commands, operands in self.programs():
+            pump.send_cmd_multi(commands, operands)
+            pump.wait4idle(pump.pump_address)
+        if verbose:
+            for step in self.steps:
+                if step.action == 'dispense':
+                    print('Dispensed ' + str(round(step.volume, 4)) + 'ml to ' + _port_name(step.port))
+
+    def describe(self):
+        """Returns the plan as readable lines with predicted start times."""
+        lines = []
+        for step in self.steps:
+            text = '%8.3f s  %-8s %-7s' % (step.start, step.action, _port_name(step.port))
+            if step.action != 'valve':
+                text += ' %.4f ml  to %d' % (step.volume, step.position)
+            lines.append(text)
+        return lines
+
+###################################################################################################################################################
+# Functions
+
+def plan_steps(requests, volumes, motion, start_position = 0, start_valve = None, source = 'Inlet', group_ports = False):
+    """Plans requests of (volume mL, destination port) for a syringe whose volumes and plunger steps are converted
+        with volumes (a cseries_volume_map). start_position is the plunger position in steps, the liquid above 0 is
+        used before aspirating more. group_ports reorders the requests so each port is visited once, otherwise they
+        run in the order given. Returns a cseries_dispense_plan timed with motion (a cseries_motion_model)."""
+    source = Valve_Pos.get(source, source)
+    if source not in Valve_Pos.values():
+        raise ValueError('Unknown source port ' + repr(source))
+    wanted = []
+    for volume, port in requests:
+        letter = Valve_Pos.get(port, port)
+        if letter not in Valve_Pos.values():
+            raise ValueError('Unknown destination port ' + repr(port))
+        if volume < 0:
+            raise ValueError('Volume to dispense can not be negative: ' + str(volume))
+        if volumes.steps(volume):
+            wanted.append((float(volume), letter))
+    if group_ports:
+        order = {}
+        for _, letter in wanted:
+            order.setdefault(letter, len(order))
+        if start_valve in order:
+            order[start_valve] = -1     # Start with the port the valve is already on
+        wanted.sort(key = lambda item: order[item[1]])
+
+    if not volumes.in_range(start_position):
+        raise ValueError('Start position ' + str(start_position) + ' outside 0-' + str(volumes.max_steps))
+    full = volumes.full_volume
+    plan = []
+    clock = 0.0
+    position = start_position
+    held = volumes.volumes(start_position)     # Liquid in the syringe, kept in mL so step rounding does not add up
+    valve = start_valve
+
+    def add(action, port, new_position, duration):
+        nonlocal clock
+        volume = None if new_position is None else abs(volumes.volumes(new_position) - volumes.volumes(position))
+        plan.append(cseries_plan_step(action, port, new_position, volume, clock, duration))
+        clock += duration
+
+    def move_valve(port):
+        nonlocal valve
+        if valve != port:
+            add('valve', port, None, motion.valve_time)
+            valve = port
+
+    remaining = sum(volume for volume, _ in wanted)
+    for volume, letter in wanted:
+        while volume > PLAN_TOLERANCE:
+            # Top up first when the liquid in the syringe is short, unless that would cost an extra aspiration later,
+            # then the liquid in the syringe goes out first and the syringe is filled after
+            if held < volume and (position == 0 or _strokes(remaining, full) == _strokes(remaining - held, full)):
+                move_valve(source)
+                held = min(full, remaining)
+                target = volumes.steps(held)
+                add('aspirate', source, target, motion.move_time(target - position))
+                position = target
+            move_valve(letter)
+            delivered = min(volume, held)
+            held -= delivered
+            target = volumes.steps(held)
+            add('dispense', letter, target, motion.move_time(position - target))
+            position = target
+            volume -= delivered
+            remaining -= delivered
+    return cseries_dispense_plan(plan, start_position, start_valve)
+
+def _strokes(volume, full):
+    """Aspirations needed to deliver volume from an empty syringe holding full mL."""
+    return ceil(volume / full - PLAN_TOLERANCE)
+
+def plan_dispense(pump, requests, source = 'Inlet', group_ports = False):
+    """Plans requests for a cseries_DT pump from its cached plunger and valve position,
+        the plunger position is queried first when the cache does not know it."""
+    if pump.state.plunger is None:
+        pump.send_cmd(CMD_REPORT_PLUNGER_POSITION, None)
+    if pump.state.plunger is None:
+        raise ValueError('Plunger position of ' + pump.config.name + ' is unknown, initialize the pump first')
+    return plan_steps(requests, pump.volumes, pump.motion, pump.state.plunger, pump.state.valve, source, group_ports)
+
+def _port_name(letter):
+    for name, value in Valve_Pos.items():
+        if value == letter:
+            return name
+    return letter
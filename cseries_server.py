@@ -0,0 +1,301 @@
+###################################################################################################################################################
+#  cseries_server.py - Resident pump server and client for Tricontinent cseries Syringe Pumps
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Keeps the serial ports open, the pumps configured and their state cached in one long running process,
+#           and takes dispense, move, valve, program and status requests over a Unix domain socket. Scripts use
+#           cseries_client instead of opening the port, configuring and initializing the pumps themselves, so a
+#           short job starts in milliseconds. Requests for one pump run one at a time, requests for different
+#           pumps from any number of clients run side by side.
+#
+#           Server:  python cseries_server.py --init                 (every pump in cseries_config.csv)
+#                    python cseries_server.py Tecan TriCont --socket /tmp/pumps.sock
+#
+#           Client:  with cseries_client() as pumps:
+#                        pumps.dispense('Tecan', 0.5)
+#                        print(pumps.status('Tecan'))
+#
+#           Wire format: one JSON object per line each way, {"op": "dispense", "pump": "Tecan", "volume": 0.5}
+#           is answered with {"ok": true, "result": ...} or {"ok": false, "error": "..."}.
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import argparse
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+
+from pathlib import Path
+
+from tricont_cseries_DT_Driver import (cseries_DT, cseries_Status, cseries_pump_error, cseries_timeout_error, Valve_Pos,
+                                       MAX_LOOP_COUNT, config_pumps, wait_all)
+from cseries_config import cseries_config_registry
+from cseries_motion import MOVE_CMDS, VALVE_CMDS, INIT_CMDS
+
+###################################################################################################################################################
+# Constants
+
+#: Default socket path of the server
+DEFAULT_SOCKET = Path(tempfile.gettempdir()) / 'cseries_pumps.sock'
+
+#: Longest request line the server reads (bytes)
+MAX_REQUEST = 65536
+
+#: Permissions of the socket file, set before the server listens
+SOCKET_MODE = 0o660
+
+#: Commands a client may send in a program request: moves, valve moves, velocity, acceleration, delays and loops.
+#: EEPROM, program storage, step mode and init commands are left out, init goes through the init request.
+PROGRAM_CMDS = MOVE_CMDS + VALVE_CMDS + ('v', 'V', 'c', 'L', 'M', 'g', 'G')
+
+###################################################################################################################################################
+# Class Definitions
+
+class cseries_server_error(RuntimeError):
+    """Raised by cseries_client when the server refuses or fails a request"""
+
+class cseries_pump_server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Class serving requests for a set of cseries_DT pumps on a Unix domain socket
+
+        Args:
+            pumps: cseries_DT pumps, opened and configured by start()
+            socket_path: Path of the socket, a stale socket file left by a crash is replaced
+        """
+    daemon_threads = True
+
+    def __init__(self, pumps, socket_path = DEFAULT_SOCKET):
+        self.pumps = {pump.config.name : pump for pump in pumps}
+        self.locks = {name : threading.Lock() for name in self.pumps}
+        self.socket_path = Path(socket_path)
+        if self.socket_path.exists():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(self.socket_path))
+            except OSError:
+                self.socket_path.unlink()       # Nobody is listening, left over from an earlier run
+            else:
+                raise cseries_server_error('A server is already running on ' + str(self.socket_path))
+            finally:
+                probe.close()
+        super().__init__(str(self.socket_path), cseries_request_handler)
+
+    def server_bind(self):
+        super().server_bind()
+        os.chmod(str(self.socket_path), SOCKET_MODE)    # Before listen, so no client connects with the default mode
+
+    def start(self, initialize = False):
+        """Opens the ports and configures every pump, with initialize also sends Z to each."""
+        for pump in self.pumps.values():
+            pump.open_serial()
+        config_pumps(list(self.pumps.values()))
+        if initialize:
+            for pump in self.pumps.values():
+                pump.send_cmd('Z', None)
+            wait_all(list(self.pumps.values()))
+
+    def server_close(self):
+        super().server_close()
+        for pump in self.pumps.values():
+            pump.close_serial()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+    def handle_request_data(self, request):
+        """Runs one decoded request and returns its result."""
+        op = request.get('op')
+        if op == 'ping':
+            return 'pong'
+        if op == 'pumps':
+            return {name : {'port' : pump.pump_port, 'address' : pump.pump_address,
+                            'syringe_volume' : pump.syringe_volume, 'max_steps' : pump.max_steps,
+                            'full_volume' : pump.volumes.full_volume}
+                    for name, pump in self.pumps.items()}
+        name = request.get('pump')
+        if name not in self.pumps:
+            raise cseries_server_error("Pump '" + str(name) + "' is not served here")
+        pump = self.pumps[name]
+        with self.locks[name]:
+            if op == 'status':
+                return self.status(pump, request.get('query', True))
+            if op == 'dispense':
+                pump.disp_ml(float(request['volume']))
+            elif op == 'move':
+                volume = float(request['volume'])
+                if not 0 <= volume <= pump.volumes.full_volume:     # Calibrated full stroke in the pump's step mode
+                    raise cseries_server_error('Position ' + str(volume) + ' mL outside the syringe of ' + name)
+                pump.move2pos_abs_ml(volume)
+                pump.wait4idle(pump.pump_address)
+            elif op == 'valve':
+                position = request['position']
+                if position not in Valve_Pos:
+                    raise cseries_server_error('Unknown valve position ' + repr(position) + ', use one of ' + ', '.join(Valve_Pos))
+                pump.switch_valve(position)
+                pump.wait4idle(pump.pump_address)
+            elif op == 'init':
+                command = request.get('command', 'Z')
+                if command not in INIT_CMDS:
+                    raise cseries_server_error('Unknown init command ' + repr(command) + ', use one of ' + ', '.join(INIT_CMDS))
+                self.wait_ready(pump, clearing = True)
+                pump.send_cmd(command, None)
+                pump.wait4idle(pump.pump_address)
+            elif op == 'program':
+                commands, operands = self.check_program(request['commands'], request['operands'])
+                self.wait_ready(pump)
+                pump.send_cmd_multi(commands, operands)
+                self.check_reply(pump)      # Reported even when the client does not wait
+                if request.get('wait', 'G' not in commands):     # A loop can run for a long time
+                    pump.wait4idle(pump.pump_address)
+            else:
+                raise cseries_server_error('Unknown request ' + repr(op))
+            self.check_reply(pump)
+            return self.status(pump, False)
+
+    def check_program(self, commands, operands):
+        """Returns the commands and operands of a program request, raises unless every command is in PROGRAM_CMDS,
+            every operand is a whole number or empty and every loop has a count."""
+        if not isinstance(commands, list) or not isinstance(operands, list) or len(operands) > len(commands):
+            raise cseries_server_error('A program needs a list of commands and a list of at most as many operands')
+        for command in commands:
+            if command not in PROGRAM_CMDS:
+                raise cseries_server_error('Command ' + repr(command) + ' not allowed, use one of ' + ', '.join(PROGRAM_CMDS))
+        operands = ['' if operand is None else str(operand) for operand in operands]
+        for operand in operands:
+            if operand and not operand.isdigit():
+                raise cseries_server_error('Operand ' + repr(operand) + ' is not a whole number')
+        for command, operand in zip(commands, operands + [''] * (len(commands) - len(operands))):
+            if command == 'G' and not (operand and 0 < int(operand) <= MAX_LOOP_COUNT):
+                raise cseries_server_error('G needs a loop count of 1-' + str(MAX_LOOP_COUNT) + ', G or G0 loops forever')
+        return list(commands), operands
+
+    def wait_ready(self, pump, clearing = False):
+        """Waits until pump is idle before a program goes out, the pump would ignore it while busy.
+            With clearing an error status is only waited out, the program about to go out clears it."""
+        try:
+            pump.wait4idle(pump.pump_address)
+        except cseries_timeout_error:
+            raise
+        except cseries_pump_error:
+            if not clearing:
+                raise
+            pump.wait4idle(pump.pump_address)   # The error is recorded now, this waits for the pump to stop
+
+    def check_reply(self, pump):
+        status = cseries_Status(pump.read_text_bytes)
+        if status.is_error:
+            raise cseries_server_error('Pump ' + pump.config.name + ' replied ' + status.record.message)
+
+    def status(self, pump, query = True):
+        """Returns the cached state of pump, with query the pump is asked for its status first."""
+        result = {'valve' : pump.state.valve, 'plunger' : pump.state.plunger, 'initialized' : pump.state.initialized,
+                  'moving' : pump.move_predicted is not None}
+        if query:
+            reply = pump.handle.transact(pump.handle.frames.status_query)
+            status = cseries_Status(reply)
+            result.update({'status' : status.record.key, 'message' : status.record.message,
+                           'busy' : status.record.busy_or_idle == 'Busy', 'error' : bool(reply) and status.is_error})
+        return result
+
+class cseries_request_handler(socketserver.StreamRequestHandler):
+    """Answers the requests of one client connection, one JSON line each"""
+    def handle(self):
+        while True:
+            line = self.rfile.readline(MAX_REQUEST)
+            if not line:
+                return
+            try:
+                request = json.loads(line)
+                reply = {'ok' : True, 'result' : self.server.handle_request_data(request)}
+            except Exception as error:      # Reported to the client, the server keeps running
+                reply = {'ok' : False, 'error' : type(error).__name__ + ': ' + str(error)}
+            self.wfile.write((json.dumps(reply) + '\n').encode())
+
+class cseries_client(object):
+    """Client for a running cseries_pump_server, one connection shared by the threads using it"""
+    def __init__(self, socket_path = DEFAULT_SOCKET):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(str(socket_path))
+        self.file = self.socket.makefile('rwb')
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def request(self, op, **args):
+        """Sends one request and returns its result, raises cseries_server_error if it failed."""
+        args['op'] = op
+        with self.lock:
+            self.file.write((json.dumps(args) + '\n').encode())
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise cseries_server_error('Server closed the connection')
+        reply = json.loads(line)
+        if not reply['ok']:
+            raise cseries_server_error(reply['error'])
+        return reply['result']
+
+    def ping(self):
+        return self.request('ping')
+
+    def pumps(self):
+        return self.request('pumps')
+
+    def status(self, pump, query = True):
+        return self.request('status', pump = pump, query = query)
+
+    def dispense(self, pump, volume):
+        return self.request('dispense', pump = pump, volume = volume)
+
+    def move(self, pump, volume):
+        """Moves the plunger to an absolute position in mL."""
+        return self.request('move', pump = pump, volume = volume)
+
+    def valve(self, pump, position):
+        return self.request('valve', pump = pump, position = position)
+
+    def init(self, pump, command = 'Z'):
+        return self.request('init', pump = pump, command = command)
+
+    def program(self, pump, commands, operands, wait = None):
+        """Runs a program, with wait the reply comes once the pump is idle. Default waits unless the program loops."""
+        if wait is None:
+            return self.request('program', pump = pump, commands = commands, operands = operands)
+        return self.request('program', pump = pump, commands = commands, operands = operands, wait = wait)
+
+###################################################################################################################################################
+# Functions
+
+def serve(pump_names = None, socket_path = DEFAULT_SOCKET, config_file = None, initialize = False):
+    """Starts a server for the named pumps (default every pump in the config) and serves until interrupted."""
+    names = pump_names or cseries_config_registry.load(config_file).names()
+    server = cseries_pump_server([cseries_DT(name, config_file) for name in names], socket_path)
+    try:
+        server.start(initialize)
+        print('Serving ' + ', '.join(names) + ' on ' + str(server.socket_path))
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Serve Tricont C-Series pumps on a Unix domain socket')
+    parser.add_argument('pumps', nargs = '*', help = 'Pump names from the config, default all')
+    parser.add_argument('--socket', default = str(DEFAULT_SOCKET))
+    parser.add_argument('--config', default = None, help = 'Configuration file, default cseries_config.csv')
+    parser.add_argument('--init', action = 'store_true', help = 'Initialize every pump (Z) at start up')
+    args = parser.parse_args()
+    serve(args.pumps, args.socket, args.config, args.init)
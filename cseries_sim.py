@@ -0,0 +1,576 @@
+###################################################################################################################################################
+#  cseries_sim.py - Software simulator for Tricontinent cseries Syringe Pumps speaking the Data Terminal Protocol
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Stand-in for the pumps on a serial port so the driver can be benchmarked and regression tested without
+#           hardware. The simulator parses /<addr><cmds>R\r frames, keeps plunger, valve and register state, times
+#           moves from the V/v/c/L settings and delays replies by the transmission time at the configured baud rate.
+#           OEM protocol packets are answered too, damaged ones are ignored and repeats are answered without running.
+#
+#           In process use:  sim = attach_sim('/dev/ttyUSB0', ('1','2'))  then use cseries_DT as normal
+#           As a pty:        python cseries_sim.py 1 2   and point the config 'Pump Port' at the printed device
+#
+#  Refrences:
+#       Tricontent CSeries User manual - c-series-manual.pdf
+#           See page 119 for Data Terminal Programming Info, Error Codes and Status Byte
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import os
+import re
+import sys
+import threading
+
+from time import monotonic, sleep
+
+from cseries_motion import cseries_motion_model, DEFAULT_VALVE_TIME, DEFAULT_INIT_TIME, MICROSTEP_SCALE
+import cseries_oem
+
+from tricont_cseries_DT_Driver import (cseries_bus, PUMP_ADDRESSES, GROUP_ADDRESSES, MAX_LOOP_COUNT,
+                                       DEFAULT_IO_BAUDRATE, DEFAULT_IO_TIMEOUT, CMD_STORE_PROGRAM,
+                                       CMD_RUN_STORED_PROGRAM, STORED_PROGRAM_SLOTS)
+
+###################################################################################################################################################
+# Constants
+
+# Error codes carried in the low bits of the status byte, see STATUS_DICT in the driver for the matching characters
+ERROR_NONE = 0
+ERROR_INIT_FAILURE = 1
+ERROR_INVALID_COMMAND = 2
+ERROR_INVALID_OPERAND = 3
+ERROR_EEPROM_FAILURE = 6
+ERROR_NOT_INITIALIZED = 7
+ERROR_PLUNGER_OVERLOAD = 9
+ERROR_VALVE_OVERLOAD = 10
+ERROR_PLUNGER_STUCK = 11
+
+#: Status byte bits, 0x40 is always set and 0x20 is set while the pump is idle
+STATUS_BASE = 0x40
+STATUS_IDLE_BIT = 0x20
+
+#: Errors that stay in the status until the pump is initialized again
+STICKY_ERRORS = (ERROR_INIT_FAILURE, ERROR_EEPROM_FAILURE, ERROR_NOT_INITIALIZED, ERROR_PLUNGER_OVERLOAD,
+                 ERROR_VALVE_OVERLOAD, ERROR_PLUNGER_STUCK)
+
+#: Time between the end of a received frame and the start of the reply (sec)
+DEFAULT_TURNAROUND = 0.002
+
+# Operand ranges accepted by the simulated pump, None means the limit is the plunger travel
+OPERAND_RANGES = {
+    'A' : (0, None), 'P' : (0, None), 'D' : (0, None),
+    'v' : (1, 1000), 'V' : (1, 6000), 'c' : (0, 2700), 'L' : (1, 20), 'C' : (0, 25),
+    'N' : (0, 1), 'M' : (0, 30000), 'G' : (0, MAX_LOOP_COUNT),
+}
+# Commands that are accepted without an operand
+NO_OPERAND_CMDS = ('I', 'O', 'B', 'E', 'Z', 'Y', 'W', 'w', 'g', 'G', 'T', 'X', 'K', 'k', 'h', 'U', 'u')
+# Report commands, answered even while the pump is busy
+REPORT_CMDS = ('?', 'Q', '&')
+
+TOKEN_RE = re.compile(r'([A-Za-z?&])(-?\d*)')
+
+###################################################################################################################################################
+# Class Definitions
+
+class cseries_sim_pump(object):
+    """Class for one simulated cseries pump on a simulated bus
+
+        Args:
+            address: Data Terminal address character ('1' for address switch 0)
+            steps_n0: Plunger travel in steps in increment mode 0
+            steps_n1: Plunger travel in steps in increment mode 1 (microstep)
+            time_scale: Multiplies every move time, e.g. 0.01 runs moves 100 times faster than the hardware
+        """
+    def __init__(self, address = '1', steps_n0 = 3000, steps_n1 = 24000, time_scale = 1.0,
+                 valve_time = DEFAULT_VALVE_TIME, init_time = DEFAULT_INIT_TIME, firmware = 'C3000 SIM 1.0'):
+        self.address = address
+        self.max_steps_by_mode = {0: steps_n0, 1: steps_n1}
+        self.time_scale = time_scale
+        self.firmware = firmware
+        self.motion = cseries_motion_model(valve_time = valve_time, init_time = init_time)
+        self.cutoff_incre = 0
+        self.incre_mode = 0
+
+        self.initialized = False
+        self.plunger = 0
+        self.valve = 'i'
+        self.error = ERROR_NONE
+        self.busy_until = 0.0
+        self.timeline = []      # [t_start, t_end, plunger_from, plunger_to, valve_after, initialized_after]
+        self.buffer = ''
+        self.oem_last = (None, b'')     # Sequence number and reply of the last OEM packet run
+        self.last_program = ''
+        self.fault = ERROR_NONE
+        self.frames_received = 0
+        self.stored = {}        # Slot to stored program, kept through initialization like the EEPROM
+        self.store_writes = 0
+
+    @property
+    def max_steps(self):
+        return self.max_steps_by_mode[self.incre_mode]
+
+    def inject_fault(self, error_code = ERROR_PLUNGER_OVERLOAD):
+        """Makes the next plunger or valve move fail with error_code."""
+        self.fault = error_code
+
+    def settle(self, now):
+        """Applies every part of the timeline that has finished by now."""
+        while self.timeline and self.timeline[0][1] <= now:
+            segment = self.timeline.pop(0)
+            self.plunger, self.valve, self.initialized = segment[3], segment[4], segment[5]
+
+    def plunger_at(self, now):
+        """Plunger position at now, interpolated inside a move."""
+        self.settle(now)
+        if self.timeline and self.timeline[0][0] <= now:
+            t_start, t_end, start, end = self.timeline[0][:4]
+            return int(start + (end - start) * (now - t_start) / (t_end - t_start))
+        return self.plunger
+
+    def status_byte(self, now):
+        idle = now >= self.busy_until
+        return STATUS_BASE | (STATUS_IDLE_BIT if idle else 0) | self.error
+
+    def reply(self, cmds:str, execute:bool, now = None) -> str:
+        """Handles the command string of one frame and returns the reply string (status byte and data)."""
+        now = monotonic() if now is None else now
+        self.frames_received += 1
+        self.settle(now)
+        data = ''
+        if cmds[:1] in REPORT_CMDS:
+            data = self.report(cmds, now)
+        elif cmds == 'T':
+            self.terminate(now)
+        elif now < self.busy_until:
+            pass    # Busy, the pump ignores new programs until it is idle
+        elif cmds[:1] == CMD_STORE_PROGRAM:
+            self.store(cmds[1:])
+        elif not execute:
+            self.buffer = cmds      # Stored, runs on the next R
+        elif cmds == 'X':
+            self.run(self.last_program, now)
+        else:
+            self.run(cmds if cmds else self.buffer, now)
+            self.buffer = ''
+        return chr(self.status_byte(now)) + data
+
+    def report(self, cmds, now):
+        if cmds == 'Q':
+            return ''
+        if cmds == '&':
+            return self.firmware
+        if cmds == '?':
+            return str(self.plunger_at(now))
+        reports = {'?1': self.motion.start_velo, '?2': self.motion.top_velo, '?3': self.motion.cutoff_velo,
+                   '?4': self.plunger_at(now), '?6': self.valve,
+                   '?19': int(self.initialized), '?27': 0, '?28': 0}
+        if cmds in reports:
+            return str(reports[cmds])
+        self.error = ERROR_INVALID_COMMAND
+        return ''
+
+    def terminate(self, now):
+        """Stops the plunger where it is and drops the rest of the program."""
+        self.plunger = self.plunger_at(now)
+        if self.timeline and self.timeline[0][0] <= now:
+            self.valve, self.initialized = self.timeline[0][4], self.timeline[0][5]
+        self.timeline = []
+        self.busy_until = now
+
+    def parse(self, program):
+        """Splits a program into (command, operand) tokens, returns None after setting the error when invalid."""
+        tokens = []
+        position = 0
+        for match in TOKEN_RE.finditer(program):
+            if match.start() != position:
+                self.error = ERROR_INVALID_COMMAND
+                return None
+            position = match.end()
+            cmd, op = match.group(1), match.group(2)
+            if cmd not in OPERAND_RANGES and cmd not in NO_OPERAND_CMDS:
+                self.error = ERROR_INVALID_COMMAND
+                return None
+            if op == '' and cmd not in NO_OPERAND_CMDS:
+                self.error = ERROR_INVALID_OPERAND
+                return None
+            value = int(op) if op else None
+            if value is not None and cmd in OPERAND_RANGES:
+                low, high = OPERAND_RANGES[cmd]
+                if value < low or (high is not None and value > high):
+                    self.error = ERROR_INVALID_OPERAND
+                    return None
+            tokens.append((cmd, value))
+        if position != len(program):
+            self.error = ERROR_INVALID_COMMAND
+            return None
+        return tokens
+
+    def store(self, text):
+        """Stores the program after the slot number of an s command, it runs later with e<slot>."""
+        if self.error not in STICKY_ERRORS:
+            self.error = ERROR_NONE
+        digits = len(text) - len(text.lstrip('0123456789'))
+        if not digits or int(text[:digits]) >= STORED_PROGRAM_SLOTS:
+            self.error = ERROR_INVALID_OPERAND
+            return
+        program = text[digits:]
+        if program and self.parse(program) is not None:
+            self.stored[int(text[:digits])] = program
+            self.store_writes += 1
+
+    def run(self, program, now):
+        """Executes a program, laying its moves out on the timeline starting at now."""
+        if self.error not in STICKY_ERRORS:
+            self.error = ERROR_NONE
+        if program[:1] == CMD_RUN_STORED_PROGRAM and program[1:].isdigit():
+            program = self.stored.get(int(program[1:]))
+            if program is None:
+                self.error = ERROR_INVALID_OPERAND
+                return
+        tokens = self.parse(program)
+        if tokens is None or not tokens:
+            return
+        self.last_program = program
+
+        t = now
+        plunger = self.plunger
+        valve = self.valve
+        initialized = self.initialized
+        loops = []
+        index = 0
+        while index < len(tokens):
+            cmd, value = tokens[index]
+            if cmd in ('Z', 'Y', 'W', 'w'):
+                duration = self.motion.init_time * self.time_scale
+                self.timeline.append([t, t + duration, plunger, 0, 'i', True])
+                t += duration
+                plunger, valve, initialized = 0, 'i', True
+                self.error = ERROR_NONE
+            elif cmd in ('A', 'P', 'D', 'I', 'O', 'B', 'E'):
+                if not initialized:
+                    self.error = ERROR_NOT_INITIALIZED
+                    break
+                if self.error in STICKY_ERRORS:
+                    break       # Moves are refused until the pump is initialized again
+                if self.fault:
+                    self.error, self.fault = self.fault, ERROR_NONE
+                    break
+                if cmd in ('I', 'O', 'B', 'E'):
+                    duration = 0.0 if valve == cmd.lower() else self.motion.valve_time * self.time_scale
+                    valve = cmd.lower()
+                    target = plunger
+                else:
+                    target = value if cmd == 'A' else plunger + value if cmd == 'P' else plunger - value
+                    if target < 0 or target > self.max_steps:
+                        self.error = ERROR_INVALID_OPERAND
+                        break
+                    duration = self.motion.move_time(target - plunger) * self.time_scale
+                if duration > 0:
+                    self.timeline.append([t, t + duration, plunger, target, valve, initialized])
+                plunger = target
+                t += duration
+            elif cmd == 'N':
+                if value != self.incre_mode:
+                    plunger = plunger * MICROSTEP_SCALE if value == 1 else plunger // MICROSTEP_SCALE
+                    self.plunger = plunger
+                self.incre_mode = value
+                self.motion.microstep = value == 1
+            elif cmd == 'v':
+                self.motion.start_velo = value
+            elif cmd == 'V':
+                self.motion.top_velo = value
+            elif cmd == 'c':
+                self.motion.cutoff_velo = value
+            elif cmd == 'L':
+                self.motion.acc_slope = value
+            elif cmd == 'C':
+                self.cutoff_incre = value
+            elif cmd == 'M':
+                t += value / 1000 * self.time_scale
+            elif cmd == 'g':
+                loops.append([index, None])
+            elif cmd == 'G' and loops:
+                if not value:
+                    t = float('inf')    # Loops until terminated
+                    break
+                if loops[-1][1] is None:
+                    loops[-1][1] = value
+                loops[-1][1] -= 1
+                if loops[-1][1] > 0:
+                    index = loops[-1][0]
+                else:
+                    loops.pop()
+            index += 1
+        self.busy_until = max(t, now)
+
+class cseries_sim_serial(object):
+    """Class that stands in for serial.Serial with simulated pumps on the other end of the line
+
+        Replies become readable after the frame and reply have been transmitted at baudrate,
+        group and broadcast frames reach every addressed pump and get no reply like the hardware.
+        """
+    def __init__(self, port = 'sim', baudrate = DEFAULT_IO_BAUDRATE, timeout = DEFAULT_IO_TIMEOUT,
+                 line_delay = True, turnaround = DEFAULT_TURNAROUND):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.line_delay = line_delay
+        self.turnaround = turnaround
+        self.is_open = False
+        self.pumps = {}
+        self.frames_received = 0
+        self.bytes_received = 0
+        self._rx = bytearray()      # Host to pump bytes not yet forming a frame
+        self._tx = bytearray()      # Pump to host bytes ready to be read
+        self._pending = []          # (ready_time, reply bytes) still on the line
+        self._line_free = 0.0
+        self._cond = threading.Condition()
+        self.corrupt_frames = 0     # Frames still to be damaged on their way to the pumps, see corrupt_next
+        self.lost_replies = 0       # Replies still to be lost on their way to the host, see lose_next
+
+    def add_pump(self, address = '1', **pump_kw) -> cseries_sim_pump:
+        pump = cseries_sim_pump(address, **pump_kw)
+        self.pumps[address] = pump
+        return pump
+
+    def corrupt_next(self, count = 1):
+        """Damages the next count frames from the host, as line noise would."""
+        with self._cond:
+            self.corrupt_frames += count
+
+    def lose_next(self, count = 1):
+        """Loses the next count replies, the pumps still run the frames."""
+        with self._cond:
+            self.lost_replies += count
+
+    # serial.Serial interface
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            self._release(monotonic())
+            return len(self._tx)
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        with self._cond:
+            now = monotonic()
+            self._rx += data
+            self.bytes_received += len(data)
+            while True:
+                frame = self._take_frame()
+                if frame is None:
+                    break
+                if self.corrupt_frames:
+                    self.corrupt_frames -= 1
+                    frame = frame[:-2] + bytes((frame[-2] ^ 0x01,)) + frame[-1:]    # Flip a bit on the line
+                self._frame(frame, now)
+            self._cond.notify_all()
+        return len(data)
+
+    def read(self, size = 1) -> bytes:
+        with self._cond:
+            deadline = None if self.timeout is None else monotonic() + self.timeout
+            while True:
+                now = monotonic()
+                self._release(now)
+                if self._tx or size == 0:
+                    data = bytes(self._tx[:size])
+                    del self._tx[:size]
+                    return data
+                if not self._wait(now, deadline):
+                    return b''
+
+    def readline(self) -> bytes:
+        with self._cond:
+            deadline = None if self.timeout is None else monotonic() + self.timeout
+            while True:
+                now = monotonic()
+                self._release(now)
+                if b'\n' in self._tx:
+                    end = self._tx.index(b'\n') + 1
+                    data = bytes(self._tx[:end])
+                    del self._tx[:end]
+                    return data
+                if not self._wait(now, deadline):
+                    data = bytes(self._tx)
+                    self._tx.clear()
+                    return data
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._release(monotonic())
+            self._tx.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def flush(self):
+        pass
+
+    flushInput = reset_input_buffer
+    flushOutput = reset_output_buffer
+
+    # Line model
+    def char_time(self, count):
+        return count * 10 / self.baudrate if self.line_delay else 0.0
+
+    def _take_frame(self):
+        """Removes and returns the next complete host frame, an OEM packet ends with the checksum after ETX
+            and a Data Terminal frame with CR."""
+        rx = self._rx
+        if rx[:1] == bytes((cseries_oem.STX,)):
+            end = rx.find(cseries_oem.ETX)
+            if end < 0 or end + 1 >= len(rx):
+                return None
+            frame = bytes(rx[:end + 2])
+            del rx[:end + 2]
+            return frame
+        end = rx.find(b'\r')
+        packet_start = rx.find(cseries_oem.STX)
+        if packet_start > 0 and (end < 0 or packet_start < end):
+            del rx[:packet_start]       # Noise before a packet
+            return self._take_frame()
+        if end < 0:
+            return None
+        frame = bytes(rx[:end + 1])
+        del rx[:end + 1]
+        return frame
+
+    def _oem_frame(self, frame, now):
+        arrived = max(now, self._line_free) + self.char_time(len(frame))
+        self._line_free = arrived
+        if not cseries_oem.is_valid(frame):
+            return      # Damaged packets are ignored, the host repeats them
+        address, sequence, body = cseries_oem.unpack(frame)
+        self.frames_received += 1
+        text = body.decode(errors = 'replace')
+        execute = text.endswith('R')
+        cmds = text[:-1] if execute else text
+        if address in GROUP_ADDRESSES:
+            switches = GROUP_ADDRESSES[address]
+            for pump in self.pumps.values():
+                if pump.address in PUMP_ADDRESSES and PUMP_ADDRESSES.index(pump.address) in switches:
+                    pump.reply(cmds, execute, arrived)
+            return
+        pump = self.pumps.get(address)
+        if pump is None:
+            return
+        number = sequence & cseries_oem.SEQUENCE_MASK
+        if sequence & cseries_oem.REPEAT_BIT and pump.oem_last[0] == number:
+            reply = pump.oem_last[1]    # Repeat of a packet already run, answered without running it again
+        else:
+            status = pump.reply(cmds, execute, arrived)
+            packet = bytearray((cseries_oem.STX,)) + ('0' + status).encode() + bytes((cseries_oem.ETX,))
+            packet.append(cseries_oem.checksum(packet))
+            reply = bytes(packet)
+            pump.oem_last = (number, reply)
+        ready = arrived + (self.turnaround if self.line_delay else 0.0) + self.char_time(len(reply))
+        self._line_free = ready
+        self._reply(ready, reply)
+
+    def _frame(self, frame, now):
+        if frame[:1] == bytes((cseries_oem.STX,)):
+            return self._oem_frame(frame, now)
+        start = frame.rfind(b'/')
+        if start < 0 or len(frame) < start + 3:
+            return
+        self.frames_received += 1
+        address = chr(frame[start + 1])
+        body = frame[start + 2:-1].decode(errors = 'replace')
+        execute = body.endswith('R')
+        cmds = body[:-1] if execute else body
+        arrived = max(now, self._line_free) + self.char_time(len(frame))
+        if address in GROUP_ADDRESSES:
+            switches = GROUP_ADDRESSES[address]
+            for pump in self.pumps.values():
+                if pump.address in PUMP_ADDRESSES and PUMP_ADDRESSES.index(pump.address) in switches:
+                    pump.reply(cmds, execute, arrived)
+            self._line_free = arrived
+            return
+        pump = self.pumps.get(address)
+        if pump is None:
+            self._line_free = arrived
+            return
+        reply = ('/0' + pump.reply(cmds, execute, arrived) + '\x03\r\n').encode()
+        ready = arrived + (self.turnaround if self.line_delay else 0.0) + self.char_time(len(reply))
+        self._line_free = ready
+        self._reply(ready, reply)
+
+    def _reply(self, ready, reply):
+        if self.lost_replies:
+            self.lost_replies -= 1
+            return
+        self._pending.append((ready, reply))
+
+    def _release(self, now):
+        while self._pending and self._pending[0][0] <= now:
+            self._tx += self._pending.pop(0)[1]
+
+    def _wait(self, now, deadline):
+        """Waits for the next reply to arrive or the deadline, returns False once the deadline has passed."""
+        if deadline is not None and now >= deadline:
+            return False
+        wake = deadline
+        if self._pending:
+            wake = self._pending[0][0] if wake is None else min(wake, self._pending[0][0])
+        self._cond.wait(None if wake is None else max(wake - now, 0))
+        return True
+
+class cseries_sim_pty(object):
+    """Class that serves a cseries_sim_serial on a pseudo terminal so unmodified programs can open it as a port"""
+    def __init__(self, sim:cseries_sim_serial):
+        import tty
+        self.sim = sim
+        self.sim.timeout = 0
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.device = os.ttyname(self.slave)
+        self.running = True
+        self.thread = threading.Thread(target = self._serve, daemon = True)
+        self.thread.start()
+
+    def _serve(self):
+        import select
+        while self.running:
+            ready, _, _ = select.select([self.master], [], [], 0.001)
+            if ready:
+                self.sim.write(os.read(self.master, 1024))
+            reply = self.sim.read(1024)
+            if reply:
+                os.write(self.master, reply)
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+###################################################################################################################################################
+# Functions
+
+def attach_sim(port = '/dev/ttyUSB0', addresses = ('1',), baudrate = DEFAULT_IO_BAUDRATE, line_delay = True,
+               **pump_kw) -> cseries_sim_serial:
+    """Creates a simulated bus with one pump per address and attaches it as the bus for port,
+        every cseries_DT configured on port then talks to the simulator."""
+    sim = cseries_sim_serial(port, baudrate, line_delay = line_delay)
+    for address in addresses:
+        sim.add_pump(address, **pump_kw)
+    cseries_bus.attach(port, sim)
+    return sim
+
+if __name__ == '__main__':
+    sim_pty = cseries_sim_pty(attach_sim('sim', tuple(sys.argv[1:]) or ('1',)))
+    print('Simulated pumps ' + ', '.join(sim_pty.sim.pumps) + ' on ' + sim_pty.device)
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        sim_pty.close()
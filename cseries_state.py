@@ -0,0 +1,72 @@
+###################################################################################################################################################
+#  cseries_state.py - Host side state cache for Tricontinent cseries Syringe Pumps
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Tracks valve position, plunger position, initialization and configuration registers of a pump from the
+#           commands sent to it and the replies it gives, so the driver only queries the pump when the cache is invalid
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+from cseries_motion import walk_program, MOVE_CMDS, VALVE_CMDS, INIT_CMDS
+
+###################################################################################################################################################
+# Constants
+
+#: Configuration registers the cache keeps (increment mode, slope code, start/top/cutoff velocity, cutoff increments)
+CONFIG_REGISTERS = ('N', 'L', 'v', 'V', 'c', 'C')
+
+###################################################################################################################################################
+# Class Definitions
+
+class cseries_pump_state(object):
+    """Class holding what the host knows about one pump, None means unknown and has to be queried
+
+        The positions are the ones the pump will hold once the last program sent has finished.
+        """
+    def __init__(self):
+        self.valve = None
+        self.plunger = None
+        self.initialized = None
+        self.registers = {}
+
+    def invalidate(self):
+        """Forgets everything, used after an error, a terminate or a lost reply."""
+        self.valve = None
+        self.plunger = None
+        self.initialized = None
+        self.registers = {}
+
+    def apply_program(self, commands, operands):
+        """Updates the cache with the effect of a program the pump accepted."""
+        for cmd, value in walk_program(commands, operands):
+            if cmd in MOVE_CMDS and value is not None:
+                if cmd == 'A':
+                    self.plunger = value
+                elif self.plunger is not None:
+                    self.plunger += value if cmd == 'P' else -value
+            elif cmd in VALVE_CMDS:
+                self.valve = cmd
+            elif cmd in INIT_CMDS:
+                self.initialized = True
+                self.plunger = 0
+                self.valve = None       # Valve ends up on the side picked by the init command and EEPROM settings
+            elif cmd == 'T' or cmd == 'G':
+                self.valve = None       # Stopped part way or looping forever
+                self.plunger = None
+            elif cmd in CONFIG_REGISTERS and value is not None:
+                if cmd == 'N' and self.registers.get('N') != value:
+                    self.plunger = None     # Step units change with the increment mode
+                self.registers[cmd] = value
+
+    def apply_report(self, command, operand, data:str):
+        """Updates the cache from the data of a report command reply."""
+        report = command + (operand or '')
+        if report == '?6' and data:
+            self.valve = data.upper()
+        elif report == '?' and data.isdigit():
+            self.plunger = int(data)
+        elif report == '?19' and data.isdigit():
+            self.initialized = data != '0'
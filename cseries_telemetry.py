@@ -0,0 +1,225 @@
+###################################################################################################################################################
+#  cseries_telemetry.py - Background telemetry sampling for Tricontinent cseries Syringe Pumps
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Polls plunger position, start/top/cutoff velocity, valve position and status of a pump at a fixed rate from
+#           a background thread and keeps the samples in a fixed size ring buffer allocated up front, so sampling 16
+#           pumps at 10 Hz for hours does not grow memory. Sample frames only use the bus when no control frame is
+#           waiting for it, a skipped field is stored as NaN. Windows of samples export as NumPy arrays or CSV.
+#
+#           sampler = cseries_sampler(pump, rate_hz = 10)
+#           sampler.start()
+#           ...
+#           window = sampler.buffer.to_numpy(seconds = 30)
+#           sampler.buffer.to_csv('pump1.csv')
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import csv
+import threading
+
+from array import array
+from pathlib import Path
+from time import monotonic
+
+try:
+    import numpy as np
+except ImportError:     # Only needed for to_numpy
+    np = None
+
+from tricont_cseries_DT_Driver import cseries_Status
+
+###################################################################################################################################################
+# Constants
+
+NAN = float('nan')
+
+#: Report command and operand of each telemetry field
+TELEMETRY_FIELDS = {
+    'plunger' : ('?', None),
+    'start_velo' : ('?', '1'),
+    'top_velo' : ('?', '2'),
+    'cutoff_velo' : ('?', '3'),
+    'valve' : ('?', '6'),
+}
+
+#: Numbers the valve positions are stored as
+VALVE_CODES = {'I' : 0, 'O' : 1, 'B' : 2, 'E' : 3}
+
+DEFAULT_RATE_HZ = 10.0
+#: Samples kept per pump, 10 minutes at the default rate
+DEFAULT_CAPACITY = 6000
+
+###################################################################################################################################################
+# Class Definitions
+
+class cseries_ring_buffer(object):
+    """Class holding the newest capacity samples of a fixed set of fields
+
+        Every column is an array of doubles allocated once, appending overwrites the oldest sample.
+        Each sample has the columns 'time' (monotonic seconds), 'status' (status byte) and then the fields.
+        """
+    def __init__(self, fields, capacity = DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        self.columns = ('time', 'status') + tuple(fields)
+        self.capacity = capacity
+        self.data = {column: array('d', [NAN]) * capacity for column in self.columns}
+        self.written = 0        # Samples appended since creation, the next one goes to written % capacity
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.written, self.capacity)
+
+    def append(self, values):
+        """Adds one sample, values in the order of columns."""
+        with self.lock:
+            slot = self.written % self.capacity
+            for column, value in zip(self.columns, values):
+                self.data[column][slot] = value
+            self.written += 1
+
+    def clear(self):
+        with self.lock:
+            self.written = 0
+
+    def _span(self, seconds = None, last = None):
+        """Returns (first slot, sample count) of the newest samples, oldest first. Call with the lock held."""
+        count = len(self)
+        if last is not None:
+            count = min(count, last)
+        if seconds is not None and count:
+            times = self.data['time']
+            cutoff = times[(self.written - 1) % self.capacity] - seconds
+            low, high = 0, count        # Times increase along the ring, find the first inside the window
+            offset = (self.written - count) % self.capacity
+            while low < high:
+                middle = (low + high) // 2
+                if times[(offset + middle) % self.capacity] < cutoff:
+                    low = middle + 1
+                else:
+                    high = middle
+            count -= low
+        return (self.written - count) % self.capacity, count
+
+    def window(self, seconds = None, last = None):
+        """Returns the newest samples as a dict of column lists, oldest first.
+            seconds limits the window to samples that recent, last to that many samples."""
+        with self.lock:
+            first, count = self._span(seconds, last)
+            return {column: [values[(first + index) % self.capacity] for index in range(count)]
+                    for column, values in self.data.items()}
+
+    def to_numpy(self, seconds = None, last = None):
+        """Like window, with each column a NumPy float64 array."""
+        if np is None:
+            raise ImportError('NumPy is needed for to_numpy')
+        with self.lock:
+            first, count = self._span(seconds, last)
+            slots = (first + np.arange(count)) % self.capacity
+            return {column: np.frombuffer(values, dtype = np.float64)[slots] for column, values in self.data.items()}
+
+    def to_csv(self, csv_file, seconds = None, last = None):
+        """Writes the window as a CSV file with one row per sample, returns the path."""
+        columns = self.window(seconds, last)
+        path = Path(csv_file)
+        with path.open('w', newline = '') as file:
+            writer = csv.writer(file)
+            writer.writerow(self.columns)
+            writer.writerows(zip(*(columns[column] for column in self.columns)))
+        return path
+
+class cseries_sampler(object):
+    """Class polling telemetry of one cseries_DT pump from a background thread
+
+        Samples are taken on a fixed schedule from start(), a late sample does not shift the ones after it.
+        Sampling only reads the pump, it does not change the pump's state cache.
+        """
+    def __init__(self, pump, rate_hz = DEFAULT_RATE_HZ, capacity = DEFAULT_CAPACITY, fields = tuple(TELEMETRY_FIELDS)):
+        if rate_hz <= 0:
+            raise ValueError('rate_hz must be positive')
+        for field in fields:
+            if field not in TELEMETRY_FIELDS:
+                raise ValueError('Unknown telemetry field ' + repr(field))
+        self.pump = pump
+        self.period = 1.0 / rate_hz
+        self.fields = tuple(fields)
+        self.frames = [pump.handle.frames.frame(*TELEMETRY_FIELDS[field]) for field in self.fields]
+        self.buffer = cseries_ring_buffer(self.fields, capacity)
+        self.skipped = 0        # Field reads given up because control traffic held the bus
+        self.missed = 0         # Sample times passed while the previous sample was still running
+        self.stopping = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target = self.run, name = 'cseries_sampler ' + self.pump.config.name, daemon = True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        next_time = monotonic()
+        while not self.stopping.is_set():
+            self.sample()
+            next_time += self.period
+            late = monotonic() - next_time
+            if late > 0:
+                skip = int(late // self.period) + 1
+                self.missed += skip
+                next_time += skip * self.period
+            self.stopping.wait(next_time - monotonic())
+
+    def sample(self):
+        """Reads every field once and appends the sample to the buffer."""
+        bus = self.pump.bus
+        address = self.pump.pump_address
+        values = [monotonic(), NAN]
+        for field, frame in zip(self.fields, self.frames):
+            reply = bus.transact_background(address, frame)
+            if not reply:
+                self.skipped += 1
+                values.append(NAN)
+                continue
+            status = cseries_Status(reply)
+            if status.status:
+                values[1] = ord(status.status)
+            values.append(_field_value(field, status.data))
+        self.buffer.append(values)
+
+###################################################################################################################################################
+# Functions
+
+def _field_value(field, data):
+    if field == 'valve':
+        return VALVE_CODES.get(data.upper(), NAN)
+    try:
+        return float(data)
+    except ValueError:
+        return NAN
+
+def start_samplers(pumps, rate_hz = DEFAULT_RATE_HZ, capacity = DEFAULT_CAPACITY, fields = tuple(TELEMETRY_FIELDS)):
+    """Starts a sampler for each pump, returns them in the same order."""
+    samplers = [cseries_sampler(pump, rate_hz, capacity, fields) for pump in pumps]
+    for sampler in samplers:
+        sampler.start()
+    return samplers
+
+def stop_samplers(samplers):
+    for sampler in samplers:
+        sampler.stopping.set()
+    for sampler in samplers:
+        sampler.stop()
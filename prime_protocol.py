@@ -1,4 +1,5 @@
 from tricont_cseries_DT_Driver import cseries_DT
+from cseries_library import cseries_program_library
 
 
 prime = cseries_DT('Test1')
@@ -16,7 +17,10 @@ cseries_DT.wait4idle(prime, prime.pump_address)
 multi_commands = ['g','I','A','O','A','G']
 multi_operands = ['','','3000','','41','25']
 
-cseries_DT.send_cmd_multi(prime, multi_commands,multi_operands)
+# Stored on the pump the first time, later runs only send the short run frame
+library = cseries_program_library()
+library.add('prime', multi_commands, multi_operands)
+library.run(prime, 'prime')
 
 cseries_DT.wait4idle(prime, prime.pump_address)
 
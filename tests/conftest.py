@@ -0,0 +1,66 @@
+###################################################################################################################################################
+#  conftest.py - Shared fixtures running the cseries driver against the simulator
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+#  Purpose: Builds a fleet config in a temporary directory and attaches simulated pumps to its ports, so every test
+#           talks to cseries_sim instead of hardware. Init and valve times are shortened on the simulator and on the
+#           drivers' motion models alike, so predicted waits stay short and match the simulated moves.
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import itertools
+import sys
+
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cseries_config import generate_fleet, write_config
+from cseries_sim import attach_sim
+from tricont_cseries_DT_Driver import cseries_DT, PUMP_ADDRESSES, config_pumps, wait_all
+
+###################################################################################################################################################
+# Constants
+
+#: Init and valve times of the simulated pumps and of the drivers' motion models (sec)
+TEST_INIT_TIME = 0.1
+TEST_VALVE_TIME = 0.02
+
+_ports = itertools.count()
+
+###################################################################################################################################################
+# Fixtures
+
+@pytest.fixture
+def sim_rig(tmp_path):
+    """Returns make(count, ports = 1, initialize = True, **settings) -> (sims, pumps).
+        Every call gets new port names, so buses from other tests are never shared."""
+    opened = []
+
+    def make(count = 1, ports = 1, initialize = True, **settings):
+        names = ['sim://test' + str(next(_ports)) for _ in range(ports)]
+        config_file = write_config(generate_fleet(names, count, 'p{port_index}_{address_index}', baudrate = 9600, **settings),
+                                   tmp_path / ('config' + str(len(opened)) + '.csv'))
+        sims = [attach_sim(name, PUMP_ADDRESSES[:count], 9600, init_time = TEST_INIT_TIME, valve_time = TEST_VALVE_TIME)
+                for name in names]
+        pumps = [cseries_DT('p' + str(port) + '_' + str(index), config_file) for port in range(ports) for index in range(count)]
+        for pump in pumps:
+            pump.motion.init_time = TEST_INIT_TIME
+            pump.motion.valve_time = TEST_VALVE_TIME
+            pump.open_serial()
+            opened.append(pump)
+        config_pumps(pumps)
+        if initialize:
+            for pump in pumps:
+                pump.send_cmd('Z', None)
+            wait_all(pumps)
+        return sims, pumps
+
+    yield make
+    for pump in opened:
+        pump.close_serial()
@@ -0,0 +1,93 @@
+###################################################################################################################################################
+#  test_driver.py - Tests of the cseries_DT driver and shared bus against the simulator
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import pytest
+
+from tricont_cseries_DT_Driver import (cseries_Status, cseries_timeout_error, PUMP_ADDRESSES, MAX_LOST_POLLS,
+                                       config_pumps, group_start, wait_all)
+
+###################################################################################################################################################
+# Tests
+
+def test_status_query_framing(sim_rig):
+    _, (pump,) = sim_rig(1)
+    reply = pump.handle.transact(pump.handle.frames.status_query)
+    assert reply.startswith(b'/0') and reply.endswith(b'\x03\r\n')
+    assert cseries_Status(reply).status_BusyOrIdle == 'Idle'
+
+def test_move_updates_state_cache(sim_rig):
+    sims, (pump,) = sim_rig(1)
+    pump.move2pos_abs_ml(0.5)
+    pump.wait4idle(pump.pump_address)
+    assert pump.state.plunger == sims[0].pumps['1'].plunger == pump.volumes.steps(0.5)
+
+def test_out_of_range_move_raises(sim_rig):
+    _, (pump,) = sim_rig(1)
+    with pytest.raises(ValueError):
+        pump.move2pos_abs_ml(pump.volumes.full_volume * 2)
+
+def test_lost_polls_raise_timeout(sim_rig):
+    sims, (pump,) = sim_rig(1)
+    sims[0].lose_next(MAX_LOST_POLLS)
+    with pytest.raises(cseries_timeout_error):
+        pump.wait4idle(pump.pump_address)
+    assert pump.state.plunger is None
+
+def test_late_reply_is_used(sim_rig):
+    sims, (pump,) = sim_rig(1)
+    sims[0].turnaround = pump.handle.reply_timeout() * 1.5
+    pump.send_cmd('A', '600')
+    sims[0].turnaround = 0.002
+    assert cseries_Status(pump.read_text_bytes).status_BusyOrIdle == 'Busy'
+    pump.wait4idle(pump.pump_address)
+    assert pump.state.plunger == 600
+
+def test_oem_packet_is_repeated_after_damage(sim_rig):
+    sims, (pump,) = sim_rig(1, protocol = 'OEM')
+    sims[0].corrupt_next()
+    pump.send_cmd('?', None)
+    assert pump.handle.retries == 1
+    assert pump.state.plunger == 0
+
+def test_busy_config_reply_is_sent_again(sim_rig):
+    sims, (pump,) = sim_rig(1)
+    pump.send_cmd('A', '3000')
+    pump.move_predicted = None      # The driver does not know the pump is moving
+    pump.top_velo = 1500
+    pump.config_pump()
+    assert sims[0].pumps['1'].motion.top_velo == 1500
+    assert pump.state.registers.get('V') == 1500
+
+def test_config_pumps_raises_any_worker_error(sim_rig):
+    _, pumps = sim_rig(2, initialize = False)
+
+    def broken():
+        raise OSError('port gone')
+    pumps[1].config_pump = broken
+    with pytest.raises(OSError):
+        config_pumps(pumps)
+
+def test_group_start_runs_in_lockstep(sim_rig):
+    sims, pumps = sim_rig(2)
+    group_start([(pump, ['A'], ['300']) for pump in pumps])
+    wait_all(pumps)
+    assert [sims[0].pumps[address].plunger for address in PUMP_ADDRESSES[:2]] == [300, 300]
+
+def test_partial_group_load_unloads_every_pump(sim_rig):
+    sims, pumps = sim_rig(2)
+    load = pumps[1].load_cmd_multi
+
+    def lossy(commands, operands):
+        sims[0].lose_next()
+        return load(commands, operands)
+    pumps[1].load_cmd_multi = lossy
+    with pytest.raises(RuntimeError, match = pumps[1].config.name):
+        group_start([(pump, ['I', 'A'], ['', '3000']) for pump in pumps])
+    assert [pump.loaded for pump in pumps] == [None, None]
+    assert all('A' not in sims[0].pumps[address].buffer for address in PUMP_ADDRESSES[:2])
@@ -0,0 +1,36 @@
+###################################################################################################################################################
+#  test_flow.py - Tests of the two pump continuous flow against the simulator
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+from time import sleep
+
+from cseries_flow import cseries_flow_controller
+
+###################################################################################################################################################
+# Tests
+
+def test_partial_last_stroke(sim_rig):
+    sims, pumps = sim_rig(2)
+    flow = cseries_flow_controller(pumps, 20.0, stroke_ml = 0.2)
+    assert abs(flow.run(volume = 0.5) - 0.5) < 1e-9
+    assert flow.strokes == 3
+    assert [sims[0].pumps[pump.pump_address].plunger for pump in pumps] == [0, 0]
+
+def test_velocities_restored_and_buffers_empty(sim_rig):
+    sims, pumps = sim_rig(2)
+    flow = cseries_flow_controller(pumps, 20.0, stroke_ml = 0.2)
+    flow.start()
+    while pumps[1].loaded is None:      # Stopped with both strokes loaded and none run
+        sleep(0.01)
+    flow.stop()
+    for pump in pumps:
+        simulated = sims[0].pumps[pump.pump_address]
+        assert (simulated.motion.start_velo, simulated.motion.top_velo, simulated.motion.cutoff_velo) == \
+               (pump.start_velo, pump.top_velo, pump.cutoff_velo)
+        assert 'A' not in simulated.buffer
+        assert pump.loaded is None
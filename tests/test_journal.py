@@ -0,0 +1,45 @@
+###################################################################################################################################################
+#  test_journal.py - Tests of the frame journal and its reader
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+from cseries_journal import (cseries_journal, enable_journal, disable_journal, read_journal, read_exchanges,
+                             KIND_SENT, KIND_RECEIVED)
+
+###################################################################################################################################################
+# Tests
+
+def test_interleaved_ports_pair_with_their_own_requests(tmp_path):
+    journal = cseries_journal(tmp_path / 'run.csj')
+    journal.on_wire('E', '1', b'/1QR\r', 'sent')
+    journal.on_wire('F', '1', b'/1?R\r', 'sent')
+    journal.on_wire('E', '1', b'/0`\x03\r\n', 'reply')
+    journal.on_wire('F', '1', b'/0`0\x03\r\n', 'reply')
+    journal.close()
+    pairs = {exchange.port : (exchange.frame, exchange.reply) for exchange in read_exchanges(tmp_path / 'run.csj')}
+    assert pairs == {'E' : (b'/1QR\r', b'/0`\x03\r\n'), 'F' : (b'/1?R\r', b'/0`0\x03\r\n')}
+
+def test_records_are_on_disk_while_open(sim_rig, tmp_path):
+    _, (pump,) = sim_rig(1)
+    journal = enable_journal(tmp_path / 'run.csj')
+    try:
+        pump.send_cmd('?', None)
+        kinds = [record.kind for record in read_journal(tmp_path / 'run.csj')]
+    finally:
+        disable_journal(journal)
+    assert kinds.count(KIND_SENT) == 1 and kinds.count(KIND_RECEIVED) == 1
+
+def test_oem_packets_are_journaled_as_sent(sim_rig, tmp_path):
+    sims, (pump,) = sim_rig(1, protocol = 'OEM')
+    journal = enable_journal(tmp_path / 'run.csj')
+    try:
+        sims[0].corrupt_next()
+        pump.send_cmd('?', None)
+    finally:
+        disable_journal(journal)
+    sent = [record.data for record in read_journal(tmp_path / 'run.csj') if record.kind == KIND_SENT]
+    assert len(sent) == 2 and all(data[:1] == b'\x02' for data in sent)
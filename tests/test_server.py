@@ -0,0 +1,64 @@
+###################################################################################################################################################
+#  test_server.py - Tests of the resident pump server and its client against the simulator
+#
+#  Author: John Quinn
+#
+#  Created: 10/17/26
+#
+###################################################################################################################################################
+# Python Package Imports and Syntax Setup
+import os
+import stat
+import threading
+
+import pytest
+
+from cseries_server import cseries_pump_server, cseries_client, cseries_server_error, SOCKET_MODE
+
+###################################################################################################################################################
+# Fixtures
+
+@pytest.fixture
+def served(sim_rig, tmp_path):
+    """Yields (sims, pump, client) with one simulated pump behind a running server."""
+    sims, (pump,) = sim_rig(1)
+    server = cseries_pump_server([pump], tmp_path / 'pumps.sock')
+    assert stat.S_IMODE(os.stat(str(server.socket_path)).st_mode) == SOCKET_MODE
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+    with cseries_client(server.socket_path) as client:
+        yield sims, pump, client
+    server.shutdown()
+    server.socket_path.unlink()
+
+###################################################################################################################################################
+# Tests
+
+def test_move_and_status(served):
+    _, pump, client = served
+    assert client.ping() == 'pong'
+    assert client.move(pump.config.name, 0.25)['plunger'] == pump.volumes.steps(0.25)
+
+def test_move_bounded_by_full_volume(served):
+    _, pump, client = served
+    with pytest.raises(cseries_server_error):
+        client.move(pump.config.name, pump.volumes.full_volume + 0.1)
+
+@pytest.mark.parametrize('commands, operands', [(['U'], ['41']), (['A3000'], []), (['A'], ['-5']),
+                                                (['g', 'A', 'A', 'G'], ['', '300', '0', '']),
+                                                (['g', 'A', 'A', 'G'], ['', '300', '0', '0'])])
+def test_program_refused(served, commands, operands):
+    _, pump, client = served
+    with pytest.raises(cseries_server_error):
+        client.program(pump.config.name, commands, operands)
+
+def test_init_only_takes_init_commands(served):
+    _, pump, client = served
+    with pytest.raises(cseries_server_error):
+        client.init(pump.config.name, 'U41')
+    assert client.init(pump.config.name)['initialized']
+
+def test_loop_does_not_wait_by_default(served):
+    _, pump, client = served
+    assert client.program(pump.config.name, ['g', 'A', 'A', 'G'], ['', '300', '0', '2'])['moving']
+    assert client.program(pump.config.name, ['A'], ['100'])['plunger'] == 100
@@ -24,11 +24,19 @@
 # Python Package Imports and Syntax Setup 
 import serial
 import csv
+import threading
 
 from serial.tools import list_ports
-from time import sleep
+from time import sleep, monotonic
 from pathlib import Path
 from itertools import zip_longest
+from collections import namedtuple, deque
+
+from cseries_motion import cseries_motion_model, MOVE_CMDS, VALVE_CMDS, INIT_CMDS
+from cseries_state import cseries_pump_state
+from cseries_config import cseries_config_registry, ADDRESS_CHARS
+from cseries_calibration import cseries_volume_map
+import cseries_oem
 
 ###################################################################################################################################################
 # Constants / Common Strings / Dictionaries to be used in code 
@@ -67,6 +75,14 @@ CMD_EEPROM_CONFIG = 'U'      # Requires power restart to take effect
 CMD_EEPROM_LOWLEVEL_CONFIG = 'u'      # Requires power restart to take effect
 #: Command to terminate current operation
 CMD_TERMINATE = 'T'
+#: Command to wait the operand in ms, M0 is loaded to empty the command buffer
+CMD_DELAY = 'M'
+#: Command storing the rest of the frame as a program in the pump's non volatile program storage, s<slot><program>
+CMD_STORE_PROGRAM = 's'
+#: Command running a stored program, e<slot>
+CMD_RUN_STORED_PROGRAM = 'e'
+#: Number of stored program slots, 0 to STORED_PROGRAM_SLOTS - 1
+STORED_PROGRAM_SLOTS = 15
 
 CMD_Dict = {'CMD_EXECUTE' : 'R', #: Command to execute
 "CMD_INITIALIZE_VALVE_RIGHT" : 'Z',#: Command to initialise with the right valve position as output
@@ -101,6 +117,18 @@ Valve_Pos = {
     'Extra' : 'E'
 }
 
+# Pump Address Characters, index is the address switch setting 0-F on the pump
+PUMP_ADDRESSES = tuple(ADDRESS_CHARS)
+
+# Group Address Characters, value is the address switch settings that answer to the group
+# Pumps do not reply to frames sent to a group address
+GROUP_ADDRESSES = {
+    'A' : (0,1), 'C' : (2,3), 'E' : (4,5), 'G' : (6,7),             # Dual pump groups
+    'I' : (8,9), 'K' : (10,11), 'M' : (12,13), 'O' : (14,15),
+    'Q' : (0,1,2,3), 'U' : (4,5,6,7), 'Y' : (8,9,10,11), ']' : (12,13,14,15),      # Quad pump groups
+    '_' : tuple(range(16))                                          # All pumps
+}
+
 #: Microstep Mode 0
 MICRO_STEP_MODE_0 = 0
 #: Microstep Mode 2
@@ -116,10 +144,38 @@ MAX_TOP_VELOCITY_MICRO_STEP_MODE_0 = 6000
 #: The maximum top velocity for Microstep Mode 2
 MAX_TOP_VELOCITY_MICRO_STEP_MODE_2 = 48000
 
+#: Largest repeat count the G loop command accepts
+MAX_LOOP_COUNT = 30000
+
 #: default Input/Output (I/O) Baudrate
 DEFAULT_IO_BAUDRATE = 9600
 #: Default timeout for I/O operations
 DEFAULT_IO_TIMEOUT = 1
+#: Time a pump gets to start answering a frame before the reply counts as lost, on top of the transmission time
+DEFAULT_REPLY_TIMEOUT = 0.1
+#: Shortest reply timeout the adaptive timeout of a pump goes down to (sec)
+MIN_REPLY_TIMEOUT = 0.02
+#: Adaptive reply timeout is the smoothed response time of the pump plus this many mean deviations
+REPLY_TIMEOUT_DEVIATIONS = 4
+#: Weight of each new response time in the smoothed response time and in its mean deviation
+LATENCY_GAIN = 0.125
+LATENCY_DEVIATION_GAIN = 0.25
+#: Longest a single serial read blocks while waiting for reply bytes
+READ_SLICE = 0.005
+#: How long after a lost reply a late frame is still credited to the pump that sent the request
+LATE_REPLY_WINDOW = 1.0
+#: Longest Data Terminal reply expected, used for the transmission time of a reply
+MAX_REPLY_LENGTH = 24
+
+#: Most frames with operands kept by the per pump frame cache
+MAX_CACHED_FRAMES = 1024
+
+#: End of text byte that closes every Data Terminal reply, followed by CR/LF
+ETX = 0x03
+
+#: Instrumentation hooks called by every bus transaction and wait4idle, see cseries_metrics.
+#: Empty by default, the driver then skips all timing.
+INSTRUMENT_HOOKS = []
 
 #: Command for the reporting the status
 CMD_REPORT_STATUS = 'Q'
@@ -187,6 +243,23 @@ ERROR_STATUSES_BUSY = (STATUS_BUSY_INIT_FAILURE, STATUS_BUSY_INVALID_COMMAND, ST
                        STATUS_BUSY_EEPROM_FAILURE, STATUS_BUSY_NOT_INITIALIZED, STATUS_BUSY_PLUNGER_OVERLOAD,
                        STATUS_BUSY_VALVE_OVERLOAD, STATUS_BUSY_PLUNGER_STUCK)
 
+#: Error replies that initializing the pump clears. Only the idle forms are recovered from,
+#: the pump refused the program and nothing of it ran, so it can be sent again
+RECOVERABLE_STATUSES = (STATUS_IDLE_NOT_INITIALIZED, STATUS_IDLE_PLUNGER_OVERLOAD, STATUS_IDLE_VALVE_OVERLOAD)
+#: Times one refused program is sent again after initializing the pump, 0 leaves recovery off.
+#: Initializing homes the plunger and empties the syringe out the output port, so it is opt-in per pump.
+MAX_RECOVERIES = 0
+#: Plunger moves relative to the current position, a program with one is not sent again after initializing
+RELATIVE_MOVE_CMDS = ('P', 'D')
+
+#: Status polls in a row without a reply before wait4idle gives up
+MAX_LOST_POLLS = 5
+#: wait4idle gives up WAIT_TIMEOUT_FACTOR times the predicted run time plus WAIT_TIMEOUT_MARGIN after the program started (sec)
+WAIT_TIMEOUT_FACTOR = 1.5
+WAIT_TIMEOUT_MARGIN = 5.0
+#: Longest wait4idle waits when the run time can not be predicted, e.g. a loop run until terminated (sec)
+WAIT_TIMEOUT_UNPREDICTED = 600.0
+
 #consider changing Pump error status bool for some, should only be false for mechnaicla problems, invalid commands should be reported but dont hold latr operation 
 # form of dict Key : Value
 # Key = status strng vairbale name 
@@ -212,12 +285,36 @@ STATUS_DICT = {
     'STATUS_BUSY_PLUNGER_STUCK' : ['K','Plunger Stuck','Busy',False]#: Busy status for plunger not allowed to move
     }
 
+#: Immutable decoded form of one status byte
+cseries_status_record = namedtuple('cseries_status_record', ['key', 'code', 'message', 'busy_or_idle', 'ok', 'error'])
+#: Record for status bytes that are not in STATUS_DICT
+STATUS_UNKNOWN = cseries_status_record(None, None, 'ERROR STATUS CODE NOT RECOGNIZED', None, False, True)
+
+def _build_status_table():
+    table = [STATUS_UNKNOWN] * 256
+    for key, value in STATUS_DICT.items():
+        table[ord(value[0])] = cseries_status_record(key, value[0], value[1], value[2], value[3],
+                                                     value[0] in ERROR_STATUSES_IDLE + ERROR_STATUSES_BUSY)
+    return tuple(table)
+
+#: Status byte value (0-255) to cseries_status_record lookup, built once from STATUS_DICT
+STATUS_TABLE = _build_status_table()
 
 ###################################################################################################################################################
 ###################################################################################################################################################
 
 # Classs Definitions 
 
+class cseries_pump_error(RuntimeError):
+    """Raised when a pump reports an error it can not be recovered from, status is the cseries_Status of the reply"""
+    def __init__(self, message, pump_name = None, status = None):
+        super().__init__(message)
+        self.pump_name = pump_name
+        self.status = status
+
+class cseries_timeout_error(cseries_pump_error):
+    """Raised when a pump stops answering or does not finish a program in time"""
+
 class cseries_configurator(object):
     """Class for Setting up configuration files for this driver
     """
@@ -248,6 +345,7 @@ class cseries_configurator(object):
                 # Get a list of available ports
                 ports = list(serial.tools.list_ports.comports())
                 # Iterate through each port and check if the device matches the target IDs
+                used_port = None
                 for port in ports:
                     if port.vid == target_vendor_id and port.pid == target_product_id:
                         try:
@@ -257,163 +355,639 @@ class cseries_configurator(object):
                             print("Serial connection found on port:", port.device)
                         except (OSError, serial.SerialException):
                             pass  # Move on to the next port
-                    else:
-                        print('No Tricont C-Series Pumps found')
+                if used_port is None:
+                    print('No Tricont C-Series Pumps found')   # cseries_discovery.py also finds which addresses answer
 
                 new_row = [pump_name, syringe_vol,incre_mode, pump_max_steps, acc_slope_code, start_velo, top_velo, 
                         cutoff_velo, cutoff_incre,  pump_addy, used_port, baudrate, timeout]
                 
                 writer.writerow(new_row)
         
+# Create Shared Bus Class for all pumps on one serial port
+class cseries_bus(object):
+    """Class that owns the single serial connection for a port shared by every pump on that RS-485 chain
+
+        Each port gets one bus (use cseries_bus.get_bus), each pump address on it gets a lightweight handle.
+        Frames are written and answered one at a time under the bus lock so replies never interleave,
+        and every reply is routed back to the handle of the pump address that sent the frame.
+        """
+    _buses = {}
+    _buses_lock = threading.Lock()
+
+    def __init__(self, port:str, baudrate = DEFAULT_IO_BAUDRATE, timeout = DEFAULT_IO_TIMEOUT, connection = None):
+        self.port = port
+        if connection is None:
+            connection = serial.Serial(baudrate = baudrate, timeout = timeout)
+            connection.port = port
+        self.connection = connection
+        self.connection.timeout = READ_SLICE
+        self.reply_timeout = min(timeout, DEFAULT_REPLY_TIMEOUT)
+        self.reader = cseries_frame_reader(connection)
+        self.lock = threading.RLock()
+        self.handles = {}
+        self.open_count = 0
+        self.waiting = 0        # Control frames waiting for the bus
+        self.waiting_lock = threading.Lock()
+        self.stale = deque(maxlen = 16)     # (address, time) of requests whose reply timed out
+        self.unmatched_frames = 0       # Frames that arrived with no request waiting for them, given to on_wire hooks
+
+    @classmethod
+    def get_bus(cls, port:str, baudrate = DEFAULT_IO_BAUDRATE, timeout = DEFAULT_IO_TIMEOUT):
+        """Returns the bus for port, creating it the first time the port is used."""
+        with cls._buses_lock:
+            bus = cls._buses.get(port)
+            if bus is None:
+                bus = cls(port, baudrate, timeout)
+                cls._buses[port] = bus
+            elif bus.connection.baudrate != baudrate:
+                print('Warning: Bus on port ' + str(port) + ' already open at ' + str(bus.connection.baudrate) + ' baud')
+            return bus
+
+    @classmethod
+    def attach(cls, port:str, connection):
+        """Makes connection (any serial.Serial like transport, e.g. a simulator) the bus for port.
+            Pumps configured on that port then talk to it instead of opening the real port."""
+        with cls._buses_lock:
+            bus = cls(port, connection = connection)
+            cls._buses[port] = bus
+            return bus
+
+    def handle(self, address):
+        """Returns the handle for a pump address on this bus."""
+        address = str(address)
+        with self.lock:
+            pump_handle = self.handles.get(address)
+            if pump_handle is None:
+                pump_handle = cseries_bus_handle(self, address)
+                self.handles[address] = pump_handle
+            return pump_handle
+
+    def open(self):
+        """Opens the port for the first user, later users share the open connection."""
+        with self.lock:
+            if not self.connection.is_open:
+                self.connection.open()
+            self.open_count += 1
+
+    def close(self):
+        """Closes the port once the last user of the bus has closed it."""
+        with self.lock:
+            self.open_count = max(self.open_count - 1, 0)
+            if self.open_count == 0 and self.connection.is_open:
+                self.connection.close()
+
+    def transact(self, address, frame:bytes, timeout = None) -> bytes:
+        """Writes one frame and reads its reply while holding the bus.
+            Returns the reply frame, or b'' when no reply arrived within timeout (default reply_timeout)
+            plus the transmission time."""
+        pump_handle = self.handle(address)
+        if timeout is None:
+            timeout = pump_handle.reply_timeout()
+        with self.waiting_lock:
+            self.waiting += 1
+        with self.lock:
+            with self.waiting_lock:
+                self.waiting -= 1
+            hooks = tuple(INSTRUMENT_HOOKS)     # One copy, a hook added meanwhile waits for the next call
+            self.route_late_replies(hooks)
+            started = monotonic() if hooks else None
+            if pump_handle.protocol == cseries_oem.PROTOCOL_OEM:
+                reply = self.exchange_oem(pump_handle, frame, timeout, hooks)
+                written = started
+            else:
+                self.connection.write(frame)
+                written = monotonic()
+                for hook in hooks:
+                    hook.on_wire(self.port, address, frame, 'sent')
+                reply = self.reader.read_frame(timeout + self.char_time(len(frame) + MAX_REPLY_LENGTH))
+                for hook in hooks if reply else ():
+                    hook.on_wire(self.port, address, reply, 'reply')
+                if reply:
+                    pump_handle.record_latency(monotonic() - written - self.char_time(len(frame) + len(reply)))
+            if not reply:
+                pump_handle.latency = None      # Back to the full reply timeout until the pump answers again
+                self.stale.append((address, monotonic()))
+            pump_handle.last_frame = frame
+            pump_handle.last_reply = reply
+            if hooks:
+                done = monotonic()
+                for hook in hooks:
+                    hook.on_transact(self.port, address, frame, reply, written - started, done - written)
+        return reply
+
+    def send(self, address, frame:bytes):
+        """Writes a frame that gets no reply, such as a group or broadcast frame."""
+        pump_handle = self.handle(address)
+        with self.lock:
+            hooks = tuple(INSTRUMENT_HOOKS)
+            self.route_late_replies(hooks)
+            started = monotonic() if hooks else None
+            if pump_handle.protocol == cseries_oem.PROTOCOL_OEM:
+                self.exchange_oem(pump_handle, frame, 0, hooks)
+            else:
+                self.connection.write(frame)
+                for hook in hooks:
+                    hook.on_wire(self.port, address, frame, 'sent')
+            pump_handle.last_frame = frame
+            pump_handle.last_reply = b''
+            if hooks:
+                done = monotonic()
+                for hook in hooks:
+                    hook.on_transact(self.port, address, frame, b'', done - started, 0.0)
+
+    def exchange_oem(self, pump_handle, frame:bytes, timeout, hooks = ()):
+        """Sends a Data Terminal frame as an OEM packet, repeating it with the repeat bit set after
+            no reply or a damaged one. Returns the reply in Data Terminal form, b'' when every attempt failed.
+            Every packet and reply goes to the on_wire hooks as it is on the wire. Call with the bus held."""
+        address = pump_handle.address
+        body = cseries_oem.dt_body(frame)
+        sequence = pump_handle.sequence
+        pump_handle.sequence = cseries_oem.next_sequence(sequence)
+        if address in GROUP_ADDRESSES:
+            packet = cseries_oem.packet(address, sequence, body)
+            self.connection.write(packet)
+            for hook in hooks:
+                hook.on_wire(self.port, address, packet, 'sent')
+            return b''      # Group packets get no reply
+        timeout = min(timeout, cseries_oem.OEM_REPLY_TIMEOUT)
+        for attempt in range(cseries_oem.OEM_RETRIES + 1):
+            packet = cseries_oem.packet(address, sequence, body, repeat = attempt > 0)
+            if attempt:
+                pump_handle.retries += 1
+                self.reader.buffer.clear()      # Drop what is left of a damaged reply
+            self.connection.write(packet)
+            for hook in hooks:
+                hook.on_wire(self.port, address, packet, 'sent')
+            deadline = monotonic() + timeout + self.char_time(len(packet) + MAX_REPLY_LENGTH)
+            while True:
+                reply = self.reader.read_frame(max(deadline - monotonic(), 0))
+                if not reply or reply[0] == cseries_oem.STX:
+                    break
+                self.unmatched_frames += 1      # A Data Terminal reply meant for another pump
+                for hook in hooks:
+                    hook.on_wire(self.port, '', reply, 'late')
+            for hook in hooks if reply else ():
+                hook.on_wire(self.port, address, reply, 'reply')
+            if reply and cseries_oem.is_valid(reply):
+                return cseries_oem.reply_to_dt(reply)
+        return b''
+
+    def transact_background(self, address, frame:bytes, timeout = None):
+        """Like transact, for traffic such as telemetry that must not delay control frames.
+            Returns None without sending when the bus is in use or a control frame is waiting for it."""
+        if self.waiting or not self.lock.acquire(blocking = False):
+            return None
+        try:
+            if self.waiting:
+                return None
+            return self.transact(address, frame, timeout)
+        finally:
+            self.lock.release()
+
+    def route_late_replies(self, hooks = ()):
+        """Hands frames that arrived after their request timed out to the handle that sent the request,
+            so they are kept instead of being taken as the reply to the next frame.
+            The most recent lost request is the most likely one to be answered late.
+            Each frame goes to the on_wire hooks with the address it was routed to, '' when unmatched."""
+        for frame in self.reader.read_available():
+            while self.stale and monotonic() - self.stale[0][1] > LATE_REPLY_WINDOW:
+                self.stale.popleft()
+            if self.stale:
+                address = self.stale.pop()[0]
+                self.handles[str(address)].late_replies.append(frame)
+            else:
+                address = ''
+                self.unmatched_frames += 1
+            for hook in hooks:
+                hook.on_wire(self.port, address, frame, 'late')
+
+    def take_late(self, address):
+        """Returns the replies that came for address after their request timed out, oldest first, and forgets them.
+            Frames already waiting on the port are routed first."""
+        with self.lock:
+            self.route_late_replies(tuple(INSTRUMENT_HOOKS))
+            late = self.handle(address).late_replies
+            replies = list(late)
+            late.clear()
+            return replies
+
+    def char_time(self, count):
+        """Time to transmit count bytes at the bus baud rate (10 bits a byte)."""
+        return count * 10 / self.connection.baudrate
+
+class cseries_bus_handle(object):
+    """Per pump view of a cseries_bus, sends frames to one pump address"""
+    def __init__(self, bus:cseries_bus, address:str):
+        self.bus = bus
+        self.address = address
+        self.last_frame = None
+        self.last_reply = None
+        self.late_replies = deque(maxlen = 16)     # Replies that came after their request timed out, see take_late
+        self.frames = cseries_frames(address)
+        self.protocol = cseries_oem.PROTOCOL_DT
+        self.sequence = 1       # OEM sequence number of the next packet
+        self.retries = 0        # OEM packets sent again after no reply or a damaged one
+        self.latency = None     # Smoothed time the pump takes to start answering a frame (sec)
+        self.latency_deviation = 0.0
+
+    def transact(self, frame:bytes, timeout = None) -> bytes:
+        return self.bus.transact(self.address, frame, timeout)
+
+    def take_late(self):
+        return self.bus.take_late(self.address)
+
+    def record_latency(self, seconds):
+        """Adds one measured response time to the smoothed response time and its mean deviation."""
+        seconds = max(seconds, 0.0)
+        if self.latency is None:
+            self.latency = seconds
+            self.latency_deviation = seconds / 2
+        else:
+            self.latency_deviation += LATENCY_DEVIATION_GAIN * (abs(seconds - self.latency) - self.latency_deviation)
+            self.latency += LATENCY_GAIN * (seconds - self.latency)
+
+    def reply_timeout(self):
+        """Reply timeout from the measured response times of the pump, within MIN_REPLY_TIMEOUT and the bus timeout.
+            The bus timeout is used until the pump has answered, and again after a lost reply."""
+        if self.latency is None:
+            return self.bus.reply_timeout
+        timeout = self.latency + REPLY_TIMEOUT_DEVIATIONS * self.latency_deviation
+        return min(max(timeout, MIN_REPLY_TIMEOUT), self.bus.reply_timeout)
+
+class cseries_frames(object):
+    """Precompiled Data Terminal command frames for one pump address
+
+        Fixed frames (status query, valve moves, init, terminate) are built once as bytes.
+        Frames with operands are built from per command templates the first time they are used
+        and then kept, so repeated moves and polls write the same bytes object every time.
+        """
+    TEMPLATE_CMDS = ('A', 'P', 'D', 'V', 'v', 'c', 'C', 'L', 'N', 'M')
+
+    def __init__(self, address:str):
+        self.address = str(address)
+        self.head = (start_cmd_str + self.address).encode()
+        self.tail = (exe_cmd_str + end_cmd_str).encode()
+        self.status_query = self.head + CMD_REPORT_STATUS.encode() + self.tail
+        self.terminate = self.head + CMD_TERMINATE.encode() + self.tail
+        self.execute = self.head + self.tail     # Runs the program stored in the pump's command buffer
+        self.valve = {letter : self.head + letter.encode() + self.tail for letter in Valve_Pos.values()}
+        self.init = {cmd : self.head + cmd.encode() + self.tail for cmd in INIT_CMDS}
+        self.templates = {cmd : self.head + cmd.encode() + b'%d' + self.tail for cmd in self.TEMPLATE_CMDS}
+        self.cache = {}
+        self.programs = {}
+
+    def frame(self, command, operand = None) -> bytes:
+        """Returns the frame for one command and its operand (None, str or int)."""
+        key = (command, operand)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        if operand is None or operand == '':
+            built = self.head + command.encode() + self.tail
+        elif command in self.templates and str(operand).isdigit():
+            built = self.templates[command] % int(operand)
+        else:
+            built = self.head + (command + str(operand)).encode() + self.tail
+        if len(self.cache) < MAX_CACHED_FRAMES:
+            self.cache[key] = built
+        return built
+
+    def program(self, commands, operands, execute = True) -> bytes:
+        """Returns the frame for a multi command program, commands and operands paired as in send_cmd_multi.
+            Without execute the frame has no R, the pump stores the program until the execute frame."""
+        key = (tuple(commands), tuple(operands), execute)
+        cached = self.programs.get(key)
+        if cached is not None:
+            return cached
+        combined = ''.join(str(x) + str(y) for x, y in zip_longest(commands, operands, fillvalue=""))
+        built = self.head + combined.encode() + (self.tail if execute else end_cmd_str.encode())
+        if len(self.programs) < MAX_CACHED_FRAMES:
+            self.programs[key] = built
+        return built
+
+class cseries_frame_reader(object):
+    """Buffered reader that splits the bytes coming in on a bus into Data Terminal reply frames
+
+        A frame runs from '/' to the ETX byte plus the CR/LF after it, an OEM reply from STX to the
+        checksum byte after ETX. Bytes past the end of a frame
+        stay in the buffer for the next one, the one bytearray is reused for the life of the bus.
+        """
+    def __init__(self, connection):
+        self.connection = connection
+        self.buffer = bytearray()
+
+    def read_frame(self, timeout) -> bytes:
+        """Returns the next complete frame as soon as its ETX arrives, or b'' after timeout seconds."""
+        deadline = monotonic() + timeout
+        while True:
+            frame = self.take_frame()
+            if frame is not None:
+                return frame
+            if monotonic() >= deadline:
+                return b''
+            self.buffer += self.connection.read(self.connection.in_waiting or 1)    # Blocks at most READ_SLICE
+
+    def read_available(self):
+        """Returns every complete frame that can be read without waiting."""
+        waiting = self.connection.in_waiting
+        if waiting:
+            self.buffer += self.connection.read(waiting)
+        frames = []
+        frame = self.take_frame()
+        while frame is not None:
+            frames.append(frame)
+            frame = self.take_frame()
+        return frames
+
+    def take_frame(self):
+        """Removes and returns the first complete frame in the buffer, None if there is none yet."""
+        buffer = self.buffer
+        start = buffer.find(b'/')
+        packet_start = buffer.find(cseries_oem.STX)
+        if packet_start >= 0 and (start < 0 or packet_start < start):
+            # OEM reply, ends with the checksum byte after ETX
+            end = buffer.find(ETX, packet_start)
+            if end < 0 or end + 1 >= len(buffer):
+                return None
+            frame = bytes(buffer[packet_start:end + 2])
+            del buffer[:end + 2]
+            return frame
+        if start < 0:
+            return None
+        end = buffer.find(ETX, start)
+        if end < 0:
+            return None
+        stop = end + 1
+        while stop < len(buffer) and buffer[stop] in (0x0D, 0x0A):
+            stop += 1
+        frame = bytes(buffer[start:stop])
+        del buffer[:stop]       # Line noise before the '/' goes with it
+        return frame
+
 # Create Driver Class for cseries Command Driver 
 class cseries_DT(object):
     """Class for intefacing with and commanding a Trincontinent cseries Syringe Pump 
 
         """ 
-    def __init__(self, pump_name:str):
-        p = Path(__file__).with_name('cseries_config.csv')
-        with p.open('r') as file:
-            reader=csv.reader(file)
-            found_pump = False
-            for row in reader:
-                if row[0] == pump_name:
-                    self.syringe_volume = int(row[1])
-                    self.incre_mode = row[2]
-                    self.pump_max_steps = row[3]
-                    self.acc_slope = row[4]
-                    self.start_velo = row[5]
-                    self.top_velo = row[6]
-                    self.cutoff_velo = row[7]
-                    self.cutoff_incre = row[8]
-                    self.pump_address = row[9]
-                    self.pump_port = row[10]
-                    self.baudrate = int(row[11])
-                    self.timeout = int(row[12])
-                    self.connection = serial.Serial(timeout = self.timeout)
-                    self.connection.port = self.pump_port
-                    found_pump = True
-                    print('Pump found, config data loaded')
-                    break
-            if not found_pump:
-                print('Error Pump Config info not found')
+    def __init__(self, pump_name:str, config_file = None):
+        self.config = cseries_config_registry.load(config_file).get(pump_name)
+        self.syringe_volume = self.config.syringe_volume
+        self.incre_mode = self.config.incre_mode
+        self.pump_max_steps = self.config.step_mode
+        self.max_steps = self.config.max_steps
+        self.volumes = cseries_volume_map.for_pump(self, config_file)
+        self.acc_slope = self.config.acc_slope
+        self.start_velo = self.config.start_velo
+        self.top_velo = self.config.top_velo
+        self.cutoff_velo = self.config.cutoff_velo
+        self.cutoff_incre = self.config.cutoff_incre
+        self.pump_address = self.config.address
+        self.pump_port = self.config.port
+        self.baudrate = self.config.baudrate
+        self.timeout = self.config.timeout
+        self.bus = cseries_bus.get_bus(self.pump_port, self.baudrate, self.timeout)
+        self.handle = self.bus.handle(self.pump_address)
+        self.handle.protocol = self.config.protocol
+        self.connection = self.bus.connection
+        self.motion = cseries_motion_model(self.start_velo, self.top_velo, self.cutoff_velo,
+                                           self.acc_slope, microstep = self.incre_mode == 1)
+        self.state = cseries_pump_state()
+        self.move_started = None
+        self.move_predicted = None
+        self.loaded = None      # (commands, operands) stored on the pump by load_cmd_multi
+        self.last_program = None    # (commands, operands, frame) of the last program that is not a query, for recover
+        self.init_command = CMD_INITIALIZE_VALVE_RIGHT      # Initialization used by recover, the last one sent
+        self.max_recoveries = MAX_RECOVERIES    # Above 0 turns on init and resend of refused programs, see recover
+        self.recoveries = 0
+        self.failed_status = None       # Lower case error status already raised for the last program
+        print('Pump found, config data loaded')
 
     def open_serial(self):
-        self.connection.open()
+        """Opens the shared bus connection for this pump's port."""
+        self.bus.open()
         print('Opening connection on port'+str(self.pump_port))
        
     def close_serial(self):
-        """Closes the connection again."""
-        self.connection.close()
+        """Closes the connection again, the port stays open while other pumps on the bus use it."""
+        self.bus.close()
         print("Closing connection on port " + str(self.pump_port))
 
     def config_pump(self):
-        ''' Configures Pump with information from configuration file '''
-        cseries_DT.send_cmd(self, 'N', self.incre_mode)
-        if self.incre_mode == '0':
-            if  self.pump_max_steps == "1":
-                self.max_steps = 3000
-            elif self.pump_max_steps == "2":
-                self.max_steps = 24000
-            else: 
-                print('Configuration Error , Max Steps Invalid')
-                
-        elif self.incre_mode == '1':
-            if self.pump_max_steps == "1":
-                self.max_steps = 24000
-            elif self.pump_max_steps == "2":
-                self.max_steps = 196000
-            else: 
-                print('Configuration Error , Max Steps Invalid')
-                
-        else:
-            print('Configuration Error , Increment Mode Invalid')
-            exit()
-            
-        cseries_DT.wait4idle(self, self.pump_address)
-        
-
-        cseries_DT.send_cmd(self, 'L', self.acc_slope)
-        cseries_DT.wait4idle(self, self.pump_address)
-
-        cseries_DT.send_cmd(self, 'v', self.start_velo)
-        cseries_DT.wait4idle(self, self.pump_address)
+        ''' Configures Pump with information from configuration file.
+            All settings go in one frame and only registers the pump does not already hold are sent,
+            the reply to that frame is the status check. A pump still running a program ignores the frame
+            and answers busy, it is then sent again once the pump is idle.'''
+        self.max_steps = self.config.max_steps
+        commands, operands = self.config_commands()
+        if not commands:
+            return
+        cseries_DT.send_cmd_multi(self, commands, operands)
+        status_temp = cseries_Status(self.read_text_bytes)
+        if self.read_text_bytes and not status_temp.is_error and status_temp.status_BusyOrIdle == 'Busy':
+            cseries_DT.wait4idle(self, self.pump_address)
+            commands, operands = self.config_commands()     # The busy reply emptied the register cache
+            cseries_DT.send_cmd_multi(self, commands, operands)
+            status_temp = cseries_Status(self.read_text_bytes)
+            if self.read_text_bytes and not status_temp.is_error and status_temp.status_BusyOrIdle == 'Busy':
+                raise cseries_pump_error('Configuration Error , Pump ' + self.config.name + ' stayed busy',
+                                         self.config.name, status_temp)
+        if not self.read_text_bytes:
+            raise cseries_timeout_error('Pump ' + self.config.name + ' did not answer its configuration', self.config.name)
+        if status_temp.is_error:
+            raise cseries_pump_error('Configuration Error , Pump ' + self.config.name + ' replied: ' +
+                                     status_temp.status_message, self.config.name, status_temp)
 
-        cseries_DT.send_cmd(self, 'V', self.top_velo)
-        cseries_DT.wait4idle(self, self.pump_address)
+    def config_commands(self):
+        ''' Returns the commands and operands setting every config register that differs from the state cache.'''
+        settings = (('N', self.incre_mode), ('L', self.acc_slope), ('v', self.start_velo),
+                    ('V', self.top_velo), ('c', self.cutoff_velo), ('C', self.cutoff_incre))
+        commands = []
+        operands = []
+        for command, value in settings:
+            if self.state.registers.get(command) != value:
+                commands.append(command)
+                operands.append(str(value))
+        return commands, operands
 
-        cseries_DT.send_cmd(self, 'c', self.cutoff_velo)
-        cseries_DT.wait4idle(self, self.pump_address)     
+    @property
+    def string2send(self):
+        return self.cmd2send.decode()
 
-        cseries_DT.send_cmd(self, 'C', self.cutoff_incre)
-        cseries_DT.wait4idle(self, self.pump_address)    
+    @property
+    def read_text_str(self):
+        return self.read_text_bytes.decode()
 
     def send_cmd(self, command, operand):
         self.command = command
         if operand is not None:
-            cmd2send = start_cmd_str + self.pump_address + self.command + operand + exe_cmd_str + end_cmd_str
             self.operand = operand 
-        else:
-            operand = None
-            cmd2send = start_cmd_str + self.pump_address + self.command + exe_cmd_str + end_cmd_str
-            #MAKE IF STATMENT FOR EXE COMAND VS STATUS COMMAND!
-            
-        self.cmd2send = cmd2send.encode()
-        self.string2send = cmd2send
-        
-        self.connection.write(self.cmd2send)
-        self.read_text_bytes = self.connection.readline()
-    
-        self.read_text_str = self.read_text_bytes.decode()
+        self.send_program([command], [operand], self.handle.frames.frame(command, operand))
 
     def send_cmd_multi(self, commands=list, operands=list):
         self.commands = commands
         self.operands  = operands
-        combined = [x + y for x, y in zip_longest(self.commands, self.operands, fillvalue="")]
-        combined_str = ''.join(combined)
-        cmd2send = start_cmd_str + self.pump_address + combined_str + exe_cmd_str + end_cmd_str
-        #MAKE IF STATMENT FOR EXE COMAND VS STATUS COMMAND!
-            
-        self.cmd2send = cmd2send.encode()
-        self.string2send = cmd2send
-        
-        self.connection.write(self.cmd2send)
-        self.read_text_bytes = self.connection.readline()
-    
-        self.read_text_str = self.read_text_bytes.decode()
+        self.send_program(commands, operands, self.handle.frames.program(commands, operands))
+
+    def send_program(self, commands, operands, frame, resend = False):
+        """ Sends frame, the program of commands and operands, then updates the move prediction and state cache.
+            A refused program is sent again after initializing when max_recoveries allows it, see recover.
+            Other error replies are left in read_text_bytes for the caller, wait4idle raises on them."""
+        if not resend:
+            self.recoveries = 0
+        self.failed_status = None
+        if commands[0] in INIT_CMDS:
+            self.init_command = commands[0]
+        if not is_query(commands):
+            self.wait_until_ready(commands)
+            self.last_program = (commands, operands, frame)
+        self.cmd2send = frame
+        self.handle.take_late()     # Late answers to earlier frames must not pass for the reply to this one
+        self.read_text_bytes = self.handle.transact(frame)
+        if not self.read_text_bytes:
+            self.read_text_bytes = self.late_reply()
+        self.predict_move(commands, operands)
+        self.update_state(commands, operands)
+        status_temp = cseries_Status(self.read_text_bytes)
+        if status_temp.is_error:
+            self.move_predicted = None      # Refused, wait4idle polls right away and raises on the error
+            if self.can_recover(status_temp):
+                self.recover(status_temp)
+
+    def late_reply(self):
+        """ Gives the reply to the frame just sent one more reply timeout to come, returns it or b''."""
+        sleep(self.handle.reply_timeout())
+        late = self.handle.take_late()
+        return late[0] if late else b''
+
+    def wait_until_ready(self, commands):
+        """ Waits for the move predicted last to finish before sending a program the pump would ignore while busy.
+            Queries and terminate are answered while busy and go out right away."""
+        if self.move_predicted is not None and not is_query(commands) and commands[0] != CMD_TERMINATE:
+            self.wait4idle(self.pump_address)
+
+    def can_recover(self, status):
+        """ True if recover can clear the error reply to the last program and send it again."""
+        if status.status_code not in RECOVERABLE_STATUSES or self.recoveries >= self.max_recoveries:
+            return False
+        if self.last_program is None or any(cmd in RELATIVE_MOVE_CMDS for cmd in self.last_program[0]):
+            return False
+        return any(cmd in MOVE_CMDS + VALVE_CMDS + INIT_CMDS for cmd in self.last_program[0])
+
+    def recover(self, status):
+        """ Recovers from the pump refusing the last program, called with the immediate reply to it only:
+            initializes and configures the pump again and sends the program again.
+            Initializing homes the plunger, what is in the syringe goes out the output valve, so this only runs
+            for pumps with max_recoveries above 0. Raises cseries_pump_error when the error is not one initializing
+            clears (RECOVERABLE_STATUSES), the program moves relative to the plunger, or it was refused again."""
+        if not self.can_recover(status):
+            self.fail(status)
+        self.recoveries += 1
+        commands, operands, frame = self.last_program
+        print('Pump ' + self.config.name + ' refused a program with ' + status.status_message +
+              ', initializing and sending it again')
+        self.state.invalidate()
+        self.send_program([self.init_command], [None], self.handle.frames.init[self.init_command], resend = True)
+        self.wait4idle(self.pump_address)
+        config_commands, config_operands = self.config_commands()
+        if config_commands:
+            self.send_program(config_commands, config_operands,
+                              self.handle.frames.program(config_commands, config_operands), resend = True)
+        self.send_program(commands, operands, frame, resend = True)
+
+    def fail(self, status):
+        """ Raises cseries_pump_error for an error status of the last program, after forgetting the cached state."""
+        self.state.invalidate()
+        self.move_predicted = None
+        self.failed_status = status.status_code.lower()     # The pump keeps reporting it until the next program
+        raise cseries_pump_error('Pump ' + self.config.name + ' reported ' + status.status_message +
+                                 (' running ' + repr(self.last_program[2]) if self.last_program else ''),
+                                 self.config.name, status)
+
+    def load_cmd_multi(self, commands=list, operands=list):
+        """ Stores a program in the pump's command buffer without running it, run_loaded starts it
+            with a one byte command so the start can be timed closely. Returns True if the pump took it."""
+        self.wait_until_ready(commands)
+        self.read_text_bytes = self.handle.transact(self.handle.frames.program(commands, operands, execute = False))
+        accepted = bool(self.read_text_bytes) and not cseries_Status(self.read_text_bytes).is_error
+        self.loaded = (list(commands), list(operands)) if accepted else None
+        return accepted
+
+    def unload(self):
+        """ Replaces the program stored by load_cmd_multi with a 0 ms delay, so a later R or group
+            execute does nothing. Returns True if the pump took it."""
+        self.wait_until_ready([CMD_DELAY])
+        self.read_text_bytes = self.handle.transact(self.handle.frames.program([CMD_DELAY], ['0'], execute = False))
+        self.loaded = None
+        return bool(self.read_text_bytes) and not cseries_Status(self.read_text_bytes).is_error
+
+    def run_loaded(self):
+        """ Runs the program stored by load_cmd_multi."""
+        if self.loaded is None:
+            raise RuntimeError('No program loaded on pump ' + self.config.name)
+        commands, operands = self.loaded
+        self.loaded = None
+        self.recoveries = 0
+        self.failed_status = None
+        self.last_program = (commands, operands, self.handle.frames.program(commands, operands))
+        self.read_text_bytes = self.handle.transact(self.handle.frames.execute)
+        self.predict_move(commands, operands)
+        self.update_state(commands, operands)
+
+    def predict_move(self, commands, operands):
+        """ Predicts how long the program just sent will run so wait4idle can sleep through it.
+            Query and setting commands take no time and leave an earlier prediction in place."""
+        seconds, _ = self.motion.estimate_program(commands, operands, self.state.plunger, apply = True)
+        if any(cmd in MOVE_CMDS + VALVE_CMDS + INIT_CMDS + ('M',) for cmd in commands):
+            self.move_started = monotonic()
+            self.move_predicted = seconds
     
-    def wait4idle(self, address):
-        """Waits until the pump is ready. Code snippet by Alon."""
-        out_data = "/" + str(address) + "QR\r"
+    def update_state(self, commands, operands):
+        """ Updates the pump state cache from the program just sent and the reply to it.
+            A lost reply or an error status invalidates the cache so the next use queries the pump."""
+        status_temp = cseries_Status(self.read_text_bytes)
+        if status_temp.is_error:
+            self.state.invalidate()
+        elif commands[0] in (CMD_REPORT_STATUS, CMD_REPORT_PLUNGER_POSITION):
+            self.state.apply_report(commands[0], operands[0] if operands else None, status_temp.data)
+        elif status_temp.status_BusyOrIdle == 'Busy' and not any(cmd in MOVE_CMDS + VALVE_CMDS + INIT_CMDS + ('M',) for cmd in commands):
+            self.state.invalidate()     # A program that does not move only gets a busy reply when the pump ignored it
+        else:
+            self.state.apply_program(commands, operands)
+
+    def wait4idle(self, address, timeout = None):
+        """Waits until the pump is ready. Code snippet by Alon.
+            Sleeps through the last move, polls every motion.poll_early in the motion.early_window before its
+            predicted end, then with backoff.
+            Poll counts and prediction error are kept on self.motion.
+            An error status raises cseries_pump_error as soon as it is seen, the program may have partly run
+            so it is never sent again from here. Raises cseries_timeout_error after MAX_LOST_POLLS unanswered polls
+            in a row, or when the pump is still busy timeout seconds after the program started
+            (default from the predicted run time, see wait_timeout)."""
+        waiter = cseries_idle_wait(self, address, timeout)
         while True:
-            sleep(0.05)
-            self.connection.write(out_data.encode())
-            self.connection.flushInput()  # added to flush buffer from nonsense
-            back = self.connection.readline()
-            if 96 in back:  # 64 is @ (busy) and 48 is 0 (idle) 96 is ' which is also good
+            sleep(waiter.delay())
+            if waiter.check(self.bus.transact(address, waiter.frame)):
                 return True
 
     def switch_valve(self,destination_valve=str,verbose=False):
         """ Checks to see if pump is already at destination valve, then if it is not 
             Switches to the desired valve position as set by destination valve.
-            Prints message and passes if valve is already at destination."""
-        
-        cseries_DT.wait4idle(self,self.pump_address)
-        cseries_DT.send_cmd(self,'?','6')
-       
-        status_temp = cseries_Status(self.read_text_bytes)
-       # cseries_Status.parse(status_temp)
-        cseries_DT.wait4idle(self,self.pump_address)
+            Prints message and passes if valve is already at destination.
+            The valve position comes from the state cache, the pump is only queried when the cache is invalid."""
+        if self.move_predicted is not None:
+            cseries_DT.wait4idle(self,self.pump_address)    # Pump ignores a valve move while it is busy
+        if self.state.valve is None:
+            cseries_DT.send_cmd(self,'?','6')
         
         # Debugging Prints
         if verbose == True:
             print('\nSwitch Valve Debug Info')
-            print('  Response Bytes: ', self.read_text_bytes)
-            print('  Device Status Data: ' + status_temp.data)
-            print('  Device Status Data (Uppercase): ' + status_temp.data.upper())
+            print('  Last Response Bytes: ', self.read_text_bytes)
+            print('  Valve Position: ' + str(self.state.valve))
             print('  Key of destination_valve: '+ destination_valve)
             print('  Value of destination_valve: '+ Valve_Pos[destination_valve])
 
-        if status_temp.data.upper() == Valve_Pos[destination_valve]:
+        if self.state.valve == Valve_Pos[destination_valve]:
             print('\nValve is already at destination valve '+ destination_valve + '! No change made by switch_valve')
         else:
             for key,value in Valve_Pos.items():
@@ -427,20 +1001,68 @@ class cseries_DT(object):
             then calculates step position
             then perpares string to send
             then sends string using .send_cmd
-        Calculates steps from mL in the process."""
-        steps = int((self.max_steps/ int(self.syringe_volume)) * abs_ml)
-        if steps in range(self.max_steps + 1):
+        Calculates steps from mL in the process.
+        Raises ValueError for a position outside the syringe."""
+        steps = self.volumes.steps(abs_ml)
+        if not self.volumes.in_range(steps):
+            raise ValueError('Request Position ' + str(abs_ml) + ' mL is Outside Possible Range of pump ' + self.config.name +
+                             ' (0-' + str(self.volumes.full_volume) + ' mL)')
+        if steps == self.state.plunger:
+            if verbose == True:
+                print('Plunger already at Increment '+ str(steps))
+        else:
             cseries_DT.send_cmd(self,'A',str(steps))
             if verbose == True: 
                 print('Moving to Increment '+ str(steps))
-        else:
-            print("Request Position is Outside Possible Range")
-            pass  # todo: error handling
+
+    def compile_disp_ml(self,ml2disp = float):
+        """ Builds the whole aspirate/dispense cycle of disp_ml as one Data Terminal program,
+            full strokes are repeated on the pump with the g/G loop commands.
+            Returns the commands and operands lists to send with send_cmd_multi."""
+        if ml2disp < 0:
+            raise ValueError('Volume to dispense can not be negative: ' + str(ml2disp))
+        stroke_volume = self.volumes.full_volume
+        total_strokes = int(ml2disp / stroke_volume)
+        partial_vol = ml2disp - total_strokes * stroke_volume
+        partial_steps = self.volumes.steps(partial_vol)
+        full_steps = str(self.max_steps)
+
+        #Empty Current Syringe
+        commands = ['I','A']
+        operands = ['','0']
+
+        # Full Strokes, looped on the pump
+        while total_strokes > 0:
+            loops = min(total_strokes, MAX_LOOP_COUNT)
+            if loops == 1:
+                commands += ['I','A','O','A']
+                operands += ['',full_steps,'','0']
+            else:
+                commands += ['g','I','A','O','A','G']
+                operands += ['','',full_steps,'','0',str(loops)]
+            total_strokes -= loops
+
+        # Partial Stroke
+        if partial_steps > 0:
+            commands += ['I','A','O','A']
+            operands += ['',str(partial_steps),'','0']
+        return commands, operands
 
     def disp_ml(self,ml2disp = float):
-        total_strokes = int(ml2disp / int(self.syringe_volume))
-        partial_stroke = ml2disp % float(self.syringe_volume)
-        partial_vol = partial_stroke * float(self.syringe_volume)
+        """ Dispenses ml2disp to the Outlet valve.
+            The cycle is compiled into one program so it costs one frame and one wait on the bus."""
+        commands, operands = self.compile_disp_ml(ml2disp)
+        self.wait4idle(self.pump_address)
+        self.send_cmd_multi(commands, operands)
+        self.wait4idle(self.pump_address)
+
+        print("Finished Dispensing "+str(ml2disp)+"ml to Outlet")
+
+    def disp_ml_stepwise(self,ml2disp = float):
+        """ Dispenses ml2disp to the Outlet valve sending every valve switch and plunger move on its own."""
+        stroke_volume = self.volumes.full_volume
+        total_strokes = int(ml2disp / stroke_volume)
+        partial_vol = ml2disp - total_strokes * stroke_volume
 
         #Empty Current Syringe
         self.switch_valve('Inlet')
@@ -452,7 +1074,7 @@ class cseries_DT(object):
             #Aspirate Needed Volume
             self.switch_valve('Inlet')
             self.wait4idle(self.pump_address)
-            self.move2pos_abs_ml(self.syringe_volume)
+            self.move2pos_abs_ml(stroke_volume)
             self.wait4idle(self.pump_address)
             #Switch back to Outlet Valve
             self.switch_valve('Outlet')
@@ -462,49 +1084,275 @@ class cseries_DT(object):
             self.wait4idle(self.pump_address)
 
         # Dispense Partial Stroke
-        #Aspirate Needed Volume
-        self.switch_valve('Inlet')
-        self.wait4idle(self.pump_address)
-        self.move2pos_abs_ml(partial_vol)
-        self.wait4idle(self.pump_address)
-        #Switch back to Outlet Valve
-        self.switch_valve('Outlet')
-        self.wait4idle(self.pump_address)
-        #Dispense to Outlet 
-        self.move2pos_abs_ml(0)
-        self.wait4idle(self.pump_address)
+        if self.volumes.steps(partial_vol) > 0:
+            #Aspirate Needed Volume
+            self.switch_valve('Inlet')
+            self.wait4idle(self.pump_address)
+            self.move2pos_abs_ml(partial_vol)
+            self.wait4idle(self.pump_address)
+            #Switch back to Outlet Valve
+            self.switch_valve('Outlet')
+            self.wait4idle(self.pump_address)
+            #Dispense to Outlet 
+            self.move2pos_abs_ml(0)
+            self.wait4idle(self.pump_address)
 
         print("Finished Dispensing "+str(ml2disp)+"ml to Outlet")
 
+class cseries_idle_wait(object):
+    """Class holding one wait for a pump to become ready, shared by cseries_DT.wait4idle and the asyncio driver
+
+        The caller sleeps delay() seconds, sends frame to address and hands the reply to check()
+        until check() returns True. Sleeping and sending are left to the caller so the same prediction,
+        backoff, error handling, timeouts and on_wait hooks serve blocking and asyncio code.
+        """
+    def __init__(self, pump, address = None, timeout = None):
+        self.pump = pump
+        self.address = pump.pump_address if address is None else address
+        self.own = str(self.address) == str(pump.pump_address)
+        self.frame = pump.bus.handle(self.address).frames.status_query
+        self.wait_started = monotonic()
+        self.predicted = pump.move_predicted if self.own else None
+        self.move_started = pump.move_started
+        self.started = self.move_started if self.predicted is not None else self.wait_started
+        self.deadline = self.started + (wait_timeout(self.predicted) if timeout is None else timeout)
+        if self.predicted is not None and self.predicted != float('inf'):
+            self.wake = self.move_started + self.predicted - pump.motion.wake_margin
+        else:
+            self.wake = None
+        self.polls = 0
+        self.lost = 0
+        self.interval = None
+
+    def delay(self):
+        """Seconds to sleep before the next poll. Sleeps through the move to motion.early_window before the
+            predicted end, polls every motion.poll_early from there so a pump that finishes a little early shows up
+            in the prediction error, then backs off from motion.poll_min once the prediction has passed."""
+        motion = self.pump.motion
+        now = monotonic()
+        if self.wake is not None and now < self.wake:
+            self.interval = motion.poll_min
+            early = self.wake - motion.early_window
+            if now < early:
+                return early - now
+            return min(motion.poll_early, self.wake - now)
+        if self.interval is None:
+            self.interval = motion.poll_min
+            return 0
+        delay = self.interval
+        self.interval = min(self.interval * 2, motion.poll_max)
+        return delay
+
+    def check(self, back):
+        """Takes the reply to one poll, returns True once the pump is ready. Raises like wait4idle."""
+        pump = self.pump
+        address = self.address
+        self.polls += 1
+        status = cseries_Status(back)
+        self.polled = monotonic()
+        if not back or status.record is STATUS_UNKNOWN:
+            self.lost += 1
+            if self.lost >= MAX_LOST_POLLS:
+                pump.state.invalidate()
+                raise cseries_timeout_error('Pump at address ' + str(address) + ' on ' + str(pump.bus.port) +
+                                            ' stopped answering', pump.config.name if self.own else None)
+        elif status.is_error and not (self.own and status.status_code.lower() == pump.failed_status):
+            if not self.own:
+                raise cseries_pump_error('Pump at address ' + str(address) + ' reported ' + status.status_message,
+                                         None, status)
+            pump.fail(status)
+        elif status.status_BusyOrIdle == 'Idle':     # Also an error that was raised already
+            if self.predicted is not None:
+                pump.motion.record_wait(self.polls, self.predicted, self.polled - self.move_started)
+                pump.move_predicted = None
+            else:
+                pump.motion.record_wait(self.polls)
+            for hook in tuple(INSTRUMENT_HOOKS):
+                hook.on_wait(pump.config.name, pump.bus.port, address, self.polls, monotonic() - self.wait_started)
+            return True
+        else:
+            self.lost = 0
+        if monotonic() > self.deadline:
+            raise cseries_timeout_error('Pump at address ' + str(address) + ' on ' + str(pump.bus.port) +
+                                        ' still busy after ' + str(round(monotonic() - self.started, 3)) + ' s',
+                                        pump.config.name if self.own else None, status)
+        return False
+
 class cseries_Status(object):
     """ This class is used to represent a cseries pump status, the response of the device from a command.
 
         Args:
-            response: The response from the device
+            response: The response from the device (bytes, bytearray or memoryview)
+
+        The status byte is looked up in STATUS_TABLE when the object is made, the text fields
+        (response, address, status, data) are only decoded when they are read.
 
         (for more details see http://www.tricontinent.com/products/cseries-syringe-pumps)
         """
+    __slots__ = ('raw', 'start', 'record')
 
     def __init__(self, response: bytes):
+        self.raw = response
+        length = len(response)
+        start = 0
+        while start < length and response[start] != 0x2F:  # Skip line noise before the '/'
+            start += 1
+        self.start = start + 1 if start < length else 0      # Index of the address byte
+        self.record = STATUS_TABLE[response[self.start + 1]] if self.start + 1 < length else STATUS_UNKNOWN
+
+    @property
+    def response(self):
         try:
-            self.response = response.decode()
+            return bytes(self.raw).decode()
         except UnicodeDecodeError:
-            self.response = None  # type: ignore
+            return None
+
+    @property
+    def address(self):
+        return chr(self.raw[self.start]) if self.start < len(self.raw) else ''
+
+    @property
+    def status(self):
+        return chr(self.raw[self.start + 1]) if self.start + 1 < len(self.raw) else ''
+
+    @property
+    def data(self):
+        data = bytes(self.raw[self.start + 2:])
+        end = data.find(b'\x03')
+        if end >= 0:
+            data = data[:end]
+        return data.rstrip().decode(errors = 'replace')
+
+    @property
+    def stats_info_key(self):
+        return self.record.key
+
+    @property
+    def status_code(self):
+        return self.record.code
+
+    @property
+    def status_message(self):
+        return self.record.message
+
+    @property
+    def status_BusyOrIdle(self):
+        return self.record.busy_or_idle
+
+    @property
+    def status_bool(self):
+        return self.record.ok
+
+    @property
+    def is_error(self):
+        return self.record.error
 
-        if self.response is not None:
-            info = self.response.rstrip().rstrip('\x03').lstrip(start_cmd_str)
-            self.address = info[0]
-            self.status = info[1]
-            self.data = info[2:]
-        
     def parse(self):
-        for key,value in STATUS_DICT.items():
-            if value[0] == self.status:
-                self.stats_info_key= key
-                self.status_code = value[0]
-                self.status_message= value[1]
-                self.status_BusyOrIdle= value[2]
-                self.status_bool = value[3]
-                break
-            else:
-                self.status_message = 'ERROR STATUS CODE NOT RECOGNIZED'
\ No newline at end of file
+        """ Kept for older callers, the status is decoded when the object is made."""
+        return self
+
+###################################################################################################################################################
+# Functions
+
+def config_pumps(pumps):
+    """ Configures many pumps at once. Pumps on different ports are configured in parallel,
+        pumps sharing a bus send their config frames back to back.
+        Raises the first error, of any pump and any kind, once every bus is done."""
+    by_bus = {}
+    for pump in pumps:
+        by_bus.setdefault(pump.bus, []).append(pump)
+    errors = []
+
+    def config_group(group):
+        for pump in group:
+            try:
+                pump.config_pump()
+            except Exception as error:      # Serial and config errors too, raised on the calling thread
+                errors.append(error)
+
+    threads = [threading.Thread(target = config_group, args = (group,)) for group in by_bus.values()]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+def is_query(commands):
+    """ True for a report program (Q, ?<n>, &), the pump answers those while busy and they change nothing."""
+    return commands[0] in (CMD_REPORT_STATUS, '&') or commands[0].startswith(CMD_REPORT_PLUNGER_POSITION)
+
+def wait_timeout(predicted):
+    """ Time wait4idle gives a program with predicted run time (sec, None or inf when unknown) to finish."""
+    if predicted is None or predicted == float('inf'):
+        return WAIT_TIMEOUT_UNPREDICTED
+    return predicted * WAIT_TIMEOUT_FACTOR + WAIT_TIMEOUT_MARGIN
+
+def group_address(addresses):
+    """ Returns the smallest group address that reaches every pump address in addresses,
+        or None if no group does."""
+    switches = set(PUMP_ADDRESSES.index(str(address)) for address in addresses)
+    best = None
+    for group, members in GROUP_ADDRESSES.items():
+        if switches.issubset(members) and (best is None or len(members) < len(GROUP_ADDRESSES[best])):
+            best = group
+    return best
+
+def group_start(programs):
+    """ Starts programs on many pumps at the same moment. programs is a list of (pump, commands, operands).
+        Each program is stored in its pump's command buffer without running, then every bus gets one
+        group execute frame, so pumps on one bus start in lockstep with a single frame.
+        Every pump reached by the group address runs its stored program, pumps in the group that are
+        not in programs must not have a program stored. Returns the pumps, use wait_all to wait for them."""
+    by_bus = {}
+    for pump, commands, operands in programs:
+        by_bus.setdefault(pump.bus, []).append(pump)
+    addresses = {}
+    for bus, pumps in by_bus.items():
+        address = group_address(pump.pump_address for pump in pumps) if len(pumps) > 1 else pumps[0].pump_address
+        if address is None:
+            raise ValueError('No group address reaches every pump on ' + bus.port)
+        protocols = set(pump.handle.protocol for pump in pumps)
+        if len(protocols) > 1:
+            raise ValueError('Pumps started together on ' + bus.port + ' must use the same protocol')
+        addresses[bus] = (address, protocols.pop())
+    loaded = []
+    for pump, commands, operands in programs:
+        loaded.append(pump)     # Also the pump that fails, its reply may be lost with the program stored
+        if not pump.load_cmd_multi(commands, operands):
+            reply = pump.read_text_bytes
+            for other in loaded:
+                try:
+                    other.unload()      # A program left stored would run on the next R or group execute
+                except cseries_pump_error:
+                    other.loaded = None
+            raise RuntimeError('Pump ' + pump.config.name + ' did not take its program: ' + repr(reply))
+    for bus, pumps in by_bus.items():
+        address, protocol = addresses[bus]
+        handle = bus.handle(address)
+        handle.protocol = protocol
+        if len(pumps) > 1:
+            bus.send(address, handle.frames.execute)
+        else:
+            pumps[0].run_loaded()
+            continue
+        for pump in pumps:
+            commands, operands = pump.loaded
+            pump.loaded = None
+            pump.recoveries = 0
+            pump.failed_status = None
+            pump.last_program = (commands, operands, pump.handle.frames.program(commands, operands))
+            pump.predict_move(commands, operands)
+            pump.state.apply_program(commands, operands)
+    return [pump for pump, _, _ in programs]
+
+def wait_all(pumps):
+    """ Waits until every pump is idle, waiting on the pump predicted to finish first first,
+        so the whole wait lasts as long as the longest move."""
+    def predicted_end(pump):
+        if pump.move_predicted is None:
+            return 0.0
+        return pump.move_started + pump.move_predicted
+    for pump in sorted(pumps, key = predicted_end):
+        pump.wait4idle(pump.pump_address)
+    return True